@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+Headless benchmarks: runs the game's own screens without libtcod or a window,
+unthrottled, feeding them scripted input, and reports how long frames took.
+
+Usage: benchmark.py [frames] [menu|map] [record-file]
+       benchmark.py replay record-file [realtime]
+       benchmark.py events [frames]
+
+A run can be recorded, and a recording (also one made with npc.py --record)
+replayed, unthrottled or in real time. The profile of each run is written to
+$BENCHMARK_PROFILE, or to a file in the temp directory.
+"""
+import os, sys, time, tempfile, Queue
+os.environ['TCOD_BACKEND'] = 'headless'
+
+import tcod
+from tcod import headless
+import game
+from game import events, profiler, dialogs, replay
+
+# Benchmark runs must not overwrite the player's options
+game.config.save_on_exit = False
+
+PROFILE_FILE = os.environ.get('BENCHMARK_PROFILE',
+                              os.path.join(tempfile.gettempdir(), 'np-complete-benchmark-profile.txt'))
+
+def menu_script(frames):
+    """
+    Skips the title animation, opens the options menu, walks up and down its
+    list for a while, then goes back and closes the window.
+    """
+    start = max(50, frames / 5)
+    def hook(frame):
+        if frame == 1:
+            headless.push_key(vk=tcod.key.SPACE)
+        elif frame == frames:
+            headless.close_window()
+        elif frame == start:
+            headless.push_key(c='O')
+        elif frame == start + 1:
+            headless.push_key(vk=tcod.key.ENTER)
+        elif frame == frames - 10:
+            headless.push_key(vk=tcod.key.ESCAPE)
+        elif start + 1 < frame < frames - 10:
+            headless.push_key(vk=tcod.key.DOWN if (frame / 4) % 2 else tcod.key.UP)
+    return hook
+
+def map_script(frames):
+    """
+    Skips the title animation, starts a new game and pans the map view around
+    (crossing chunk boundaries), then goes back and closes the window.
+    """
+    start = max(50, frames / 5)
+    def hook(frame):
+        if frame == 1:
+            headless.push_key(vk=tcod.key.SPACE)
+        elif frame == frames:
+            headless.close_window()
+        elif frame == start:
+            headless.push_key(c='n')
+        elif frame == start + 1:
+            headless.push_key(vk=tcod.key.ENTER)
+        elif frame == frames - 10:
+            headless.push_key(vk=tcod.key.ESCAPE)
+        elif start + 1 < frame < frames - 10:
+            vk = (tcod.key.RIGHT, tcod.key.DOWN, tcod.key.LEFT, tcod.key.UP)[(frame / 40) % 4]
+            headless.push_key(vk=vk, shift=(frame % 3 == 0))
+    return hook
+
+scripts = {'menu': menu_script, 'map': map_script}
+
+def run(frames=500, script='menu', record=None):
+    """ Plays the game through script for frames frames; records its input to record, if given. """
+    if record:
+        dialogs.input_stage.recorder = replay.Recorder(record)
+    try:
+        measure(scripts[script](frames))
+    finally:
+        if record:
+            dialogs.input_stage.recorder.close(dialogs.input_stage.frames)
+            print "input recorded to %s" % record
+
+def run_replay(path, realtime=False):
+    """ Plays the game through a recording of its input. """
+    dialogs.input_source = replay.Player(path, realtime=realtime == 'realtime')
+    measure()
+
+def measure(hook=None):
+    width = game.config.parser.getint("core", "width")
+    height = game.config.parser.getint("core", "height")
+    tcod.set_custom_font('fonts/consolas12x12_gs_tc.png', tcod.font.TYPE_GREYSCALE | tcod.font.LAYOUT_TCOD)
+    tcod.init_root(width, height, title='NP-Complete')
+
+    frame_times = []
+    input_counts = [0, 0]
+    def count_input(frame):
+        input_counts[0] += dialogs.input_source.raw
+        input_counts[1] += dialogs.input_source.posted
+    headless.flush_hooks.append(count_input)
+    if hook:
+        headless.flush_hooks.append(hook)
+    headless.flush_hooks.append(lambda frame: frame_times.append(tcod.get_last_frame_length()))
+
+    profiler.profiler.profile_widgets()
+    start = time.time()
+    game.main_menu()
+    elapsed = time.time() - start
+
+    frame_times.sort()
+    print "%d frames in %.2fs: %.1f frames/s" % (len(frame_times), elapsed, len(frame_times) / elapsed)
+    print "frame time: median %.2fms, 95th percentile %.2fms, worst %.2fms" % (
+        frame_times[len(frame_times) / 2] * 1000,
+        frame_times[len(frame_times) * 95 / 100] * 1000,
+        frame_times[-1] * 1000)
+    print "color controls: %(issued)d issued, %(skipped)d skipped" % tcod.color_control.get_stats()
+    print "input events: %d raw, %d posted" % tuple(input_counts)
+    print "consoles: %(allocated)d allocated, %(reused)d reused, high water %(high_water)d in use" % \
+        tcod.console_pool.get_stats()
+
+    profiler.profiler.dump(PROFILE_FILE)
+    print "profile written to %s" % PROFILE_FILE
+
+def events_benchmark(frames=100000):
+    """
+    Posts and dispatches a frame's worth of events (a mouse event and a few
+    keys) frames times, through the old Queue.PriorityQueue design and
+    through events.Dispatcher, and reports events per second for each.
+    """
+    frame = [(events.MOUSE, None), (events.KEY, 'a'), (events.KEY, 'b'), (events.LAUNCH, None), (events.KEY, 'c')]
+
+    def priority_queue():
+        queue = Queue.PriorityQueue()
+        for i in xrange(frames):
+            for type, data in frame:
+                queue.put(events.Event(type, data))
+            try:
+                while True:
+                    queue.get(False)
+            except Queue.Empty:
+                pass
+
+    def dispatcher():
+        dispatcher = events.Dispatcher()
+        for i in xrange(frames):
+            for type, data in frame:
+                dispatcher.post(type, data)
+            for event in dispatcher.drain():
+                pass
+
+    for name, benchmark in (('Queue.PriorityQueue', priority_queue), ('events.Dispatcher', dispatcher)):
+        start = time.time()
+        benchmark()
+        elapsed = time.time() - start
+        print "%-20s %10.0f events/s" % (name, frames * len(frame) / elapsed)
+
+if __name__ == '__main__':
+    args = [int(arg) if arg.isdigit() else arg for arg in sys.argv[1:]]
+    if args and args[0] == 'events':
+        events_benchmark(*args[1:])
+    elif args and args[0] == 'replay':
+        run_replay(*args[1:])
+    else:
+        run(*args)
@@ -1,42 +1,56 @@
 """ Core functions and classes for a libtcod game. Not game-specific. """
-import time, types
+import types
 
 import tcod
-from game import config, events, widgets, dialogs
+from game import config, events, widgets, dialogs, world, animation, simulation
 
-def slow_print(widget, text, y=1):
+def slow_print(widget, text, y=1, delay=0, on_done=None):
+    """
+    Adds a label to widget that types text out, a character at a time (a key
+    press or a click shows it all at once). Returns the animation.TextReveal.
+    """
     label = widgets.Label(parent=widget, y=y, text=text)
     label.center_in_parent(vertical=False)
     label.text = ""
-
-    for char in text:
-        label.text = label.text + char
-
-        widget.render()
-        tcod.flush() # Relying on the tcod.set_fps_limit() from earlier to limit our render rate
-        key, mouse = tcod.check_for_event(tcod.event.KEY_PRESS | tcod.event.MOUSE_PRESS)
-        if key.vk != tcod.key.NONE or mouse.lbutton or mouse.rbutton:
-            label.text = text
-            widget.render()
-            return
+    return animation.scheduler.add(animation.TextReveal(label, text, delay=delay, on_done=on_done))
 
 def main_menu():
     top = widgets.Image(path="menu_bg.png", width=tcod.root_console.width, height=tcod.root_console.height)
 
-    slow_print(top, "NP-Complete")
-    time.sleep(0.2)
-    slow_print(top, "Survival is a Hard problem", y=2)
+    def show_menu():
+        m = widgets.Menu(parent=top)
+        m.add_item("n", "new game", on_activate=lambda w: events.post(events.LAUNCH, new_game))
+        m.add_item("l", "load game", disabled=True)
+        m.add_item("O", "Options", on_activate=lambda w: events.post(events.LAUNCH, options_menu))
+        m.add_item("M", "Mods", disabled=True)
+        m.add_item("q", "quit", on_activate=lambda w: events.post(events.QUIT))
+        m.center_in_parent()
 
-    m = widgets.Menu(parent=top)
-    m.add_item("n", "new game")
-    m.add_item("l", "load game", disabled=True)
-    m.add_item("O", "Options", on_activate=lambda w: events.post(events.LAUNCH, options_menu))
-    m.add_item("M", "Mods", disabled=True)
-    m.add_item("q", "quit", on_activate=lambda w: events.post(events.QUIT))
-    m.center_in_parent()
+    title = slow_print(top, "NP-Complete")
+    slow_print(top, "Survival is a Hard problem", y=2, delay=title.duration + 200, on_done=show_menu)
 
     dialogs.main_loop(top)
 
+def new_game():
+    width, height = tcod.root_console.width, tcod.root_console.height
+    log_height = 6
+
+    top = widgets.Widget(width=width, height=height)
+    the_world = world.World()
+    sim = simulation.Simulation(the_world)
+    view = widgets.MapView(the_world, parent=top, width=width, height=height - log_height, source=sim)
+    view.look_at(0, 0)
+
+    log = widgets.MessageLog(parent=top, y=view.rect.bottom, width=width, height=log_height)
+    log.add_message("Welcome to NP-Complete. Arrow keys look around, Shift to go faster.")
+
+    b = widgets.Button(parent=top, label="Main menu", key="Esc",
+                       action=lambda: events.post(events.OK))
+    b.rect.right = width - 1
+
+    sim.start()
+    dialogs.push(top, dialog=True, on_close=sim.stop)
+
 def options_menu():
     top = widgets.Dialog(width=55, height=tcod.root_console.height-6)
     top.center_in_console()
@@ -84,4 +98,4 @@ def options_menu():
         return result
     options.handle_event = types.MethodType(option_event, options, widgets.List)
 
-    dialogs.main_loop(top, dialog=True)
+    dialogs.push(top, dialog=True)
@@ -0,0 +1,144 @@
+""" Animations that advance with the clock, run alongside the main loop. """
+import tcod
+from game import events
+
+class Tween(object):
+    """
+    Something that changes over `duration` milliseconds, starting `delay`
+    milliseconds after it is scheduled. Subclasses implement update(), which
+    is given the progress (0.0 to 1.0) whenever the scheduler advances them;
+    on_done (if any) is called once progress reaches 1.0. Skippable tweens
+    are finished at once by a key press or a click in the scene of the
+    widget they animate (any scene, for a tween without one).
+    """
+    widget = None
+    def __init__(self, duration, delay=0, on_done=None, skippable=True):
+        self.duration = duration
+        self.delay = delay
+        self.on_done = on_done
+        self.skippable = skippable
+        self.start_time = None
+        self.done = False
+
+    def start(self, now):
+        self.start_time = now + self.delay
+
+    def advance(self, now):
+        """ Updates the tween for time now; False once it is done. """
+        if now < self.start_time:
+            return True
+        if self.duration <= 0 or now >= self.start_time + self.duration:
+            self.finish()
+            return False
+        self.update(float(now - self.start_time) / self.duration)
+        return True
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        self.update(1.0)
+        if self.on_done:
+            self.on_done()
+
+    def update(self, progress):
+        raise NotImplementedError
+
+class TextReveal(Tween):
+    """ Types text into a label, a few characters per second. """
+    def __init__(self, label, text, chars_per_second=25, **kwargs):
+        super(TextReveal, self).__init__(len(text) * 1000 / chars_per_second, **kwargs)
+        self.label = self.widget = label
+        self.text = text
+
+    def update(self, progress):
+        shown = self.text[:int(len(self.text) * progress)]
+        if shown != self.label.text:
+            self.label.text = shown
+
+class ColorFade(Tween):
+    """ Fades a widget's color attribute (e.g. 'fgcolor') from one color to another. """
+    def __init__(self, widget, attribute, start, end, duration, **kwargs):
+        super(ColorFade, self).__init__(duration, **kwargs)
+        self.widget = widget
+        self.attribute = attribute
+        self.start_color = start
+        self.end_color = end
+
+    def update(self, progress):
+        color = tcod.Color(*[int(a + (b - a) * progress) for a, b in zip(self.start_color, self.end_color)])
+        setattr(self.widget, self.attribute, color)
+
+class Move(Tween):
+    """ Slides a widget from where it is to (x, y), relative to its parent. """
+    def __init__(self, widget, x, y, duration, **kwargs):
+        super(Move, self).__init__(duration, **kwargs)
+        self.widget = widget
+        self.origin = None
+        self.destination = (x, y)
+
+    def update(self, progress):
+        if self.origin is None:
+            self.origin = (self.widget.rect.left, self.widget.rect.top)
+        (x0, y0), (x1, y1) = self.origin, self.destination
+        self.widget.rect.move_to(int(round(x0 + (x1 - x0) * progress)),
+                                 int(round(y0 + (y1 - y0) * progress)))
+
+class Scheduler(object):
+    """
+    Runs any number of tweens at once, advancing them all to the game time
+    (events.game_clock) once per frame (see dialogs.main_loop, which keeps
+    drawing frames only while the scheduler is active).
+    """
+    def __init__(self):
+        self.tweens = []
+
+    def add(self, tween):
+        tween.start(events.game_clock.milli)
+        self.tweens.append(tween)
+        return tween
+
+    def cancel(self, tween):
+        if tween in self.tweens:
+            self.tweens.remove(tween)
+
+    @property
+    def active(self):
+        return bool(self.tweens)
+
+    def update(self):
+        now = events.game_clock.milli
+        # Finished tweens may start new ones from on_done
+        tweens, self.tweens = self.tweens, []
+        self.tweens = [tween for tween in tweens if tween.advance(now)] + self.tweens
+
+    def skip(self, root=None):
+        """
+        Finishes the skippable tweens (only those of widgets under root, and
+        those of no widget, if root is given); True if there were any.
+        """
+        def skippable(tween):
+            return tween.skippable and (root is None or tween.widget is None or tween.widget.root is root)
+
+        skipped = False
+        # Finishing may start new tweens (which are skipped too)
+        while any(skippable(tween) for tween in self.tweens):
+            tweens, self.tweens = self.tweens, []
+            for tween in tweens:
+                if skippable(tween):
+                    tween.finish()
+                    skipped = True
+                else:
+                    self.tweens.append(tween)
+        return skipped
+
+scheduler = Scheduler()
+
+def handle_event(ev, root=None):
+    """ A key press or a click skips what is animating (under root, if given). """
+    if not scheduler.active:
+        return False
+    if ev.type is events.KEY or (ev.type is events.MOUSE and
+                                 (ev.data.lbutton_pressed or ev.data.rbutton_pressed)):
+        return scheduler.skip(root)
+    return False
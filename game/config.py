@@ -66,15 +66,21 @@ def key_option_handler(section, option):
             if event.data.vk in (tcod.key.BACKSPACE, tcod.key.LEFT):
                 parser.set(section, option, 'None')
             elif event.data.vk in (tcod.key.ENTER, tcod.key.RIGHT):
-                value = dialogs.keybind_dialog()
-                if value:
-                    parser.set(section, option, value)
+                def set_key(value):
+                    if value:
+                        parser.set(section, option, value)
+                dialogs.keybind_dialog(on_result=set_key)
             return True
         return False
     return handler
 
+# Whether the options are written back to data/config.cfg at exit
+save_on_exit = True
+
 @atexit.register
 def save():
+    if not save_on_exit:
+        return
     try:
         with open("data/config.cfg", "w") as f:
             f.write("# Generated %s\n\n" % dt.now().ctime())
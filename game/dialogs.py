@@ -1,40 +1,319 @@
 import types
+from timeit import default_timer as clock
 
 import tcod
-from game import events, widgets, utils
+from game import events, widgets, utils, profiler, animation, tasks, jobs
 
-def get_input():
-    """ Grab the mouse and all the key events from libtcod and {events.post} them. """
-    key, mouse = tcod.check_for_event(tcod.event.KEY_PRESS | tcod.event.MOUSE)
-    events.post(events.MOUSE, mouse)
-    while key.vk != tcod.key.NONE:
-        events.post(events.KEY, key)
-        key, mouse = tcod.check_for_event(tcod.event.KEY_PRESS)
+# Seconds per frame at the frame limit (npc.py sets it from the configured
+# fps); jobs and background tasks get what the frame leaves of it.
+frame_budget = 1.0 / 25
+
+class InputStage(object):
+    """
+    Turns what libtcod reports into events. Mouse motion is collapsed to the
+    latest position each frame, and posted only if the cursor moved to
+    another cell; button and wheel events are always posted. Repeats of the
+    same key (e.g. while it is held down) are dropped once they come faster
+    than key_repeat_rate a second, unless that is 0 -- but the keys read in
+    one poll all have the frame's time, so there a key pressed again right
+    after it was posted is let through once.
+
+    Each poll() sets the frame's game time (see events.GameClock) once the
+    input is in. raw and posted count the events of the last poll(), before
+    and after all that; frames counts the polls. A recorder (see
+    replay.Recorder), if set, is given each frame's time and every event
+    posted. waited is how long the last poll() waited for input.
+
+    libtcod can only wait for input with no time limit, so a poll() that
+    has to be done by a deadline, or while a background task waits for a
+    call in another thread or another thread may post events (see
+    events.Dispatcher.open_inbox), looks for input every idle_step seconds
+    (sleeping in between) instead.
+    """
+    idle_step = 0.01
+
+    def __init__(self, key_repeat_rate=0):
+        self.key_repeat_rate = key_repeat_rate
+        self.mouse_cell = None
+        self.last_key = None
+        self.last_key_time = 0
+        self.last_key_frame = None
+        self.repeated = False # whether a repeat got through in this poll
+        self.raw = self.posted = 0
+        self.frames = 0
+        self.waited = 0.0
+        self.recorder = None
+
+    def poll(self, wait=False, deadline=None):
+        """
+        Posts the events since the last poll. If wait, blocks until there is
+        one -- or until deadline (in game time) if that is given, an event
+        is posted from another thread with the inbox open, or a background
+        task can go on.
+        """
+        self.raw = self.posted = 0
+        self.repeated = False
+        motion = None
+
+        start = clock()
+        mask = tcod.event.KEY_PRESS | tcod.event.MOUSE
+        if wait and (deadline is not None or tasks.loop.waiting or events.dispatcher.inbox_writers):
+            event, key, mouse = tcod.next_event(mask)
+            while not event and not events.pending() and not tasks.loop.pending:
+                step = self.idle_step
+                if deadline is not None:
+                    step = min(step, deadline - events.game_clock.elapsed())
+                    if step <= 0:
+                        break
+                tcod.sleep_milli(max(1, int(step * 1000)))
+                event, key, mouse = tcod.next_event(mask)
+        else:
+            event, key, mouse = tcod.next_event(mask, wait=wait)
+        self.waited = clock() - start if wait else 0.0
+
+        milli = events.game_clock.tick()
+        if self.recorder:
+            self.recorder.record_frame(self.frames, milli)
+        while event:
+            self.raw += 1
+            if event & tcod.event.KEY_PRESS:
+                self.post_key(key)
+            elif event & (tcod.event.MOUSE_PRESS | tcod.event.MOUSE_RELEASE):
+                motion = None # this has the latest position too
+                self.post_mouse(mouse)
+            else:
+                motion = mouse
+            event, key, mouse = tcod.next_event(mask)
+
+        if motion is not None and (motion.cx, motion.cy) != self.mouse_cell:
+            self.post_mouse(motion)
+        self.frames += 1
+
+    def post(self, type, data):
+        events.post(type, data)
+        self.posted += 1
+        if self.recorder:
+            self.recorder.record(self.frames, type, data)
+
+    def post_mouse(self, mouse):
+        self.mouse_cell = (mouse.cx, mouse.cy)
+        self.post(events.MOUSE, mouse)
+
+    def post_key(self, key):
+        now = events.game_clock.milli
+        identity = (key.vk, key.c, key.shift, key.lalt, key.ralt, key.lctrl, key.rctrl)
+        if identity == self.last_key and self.key_repeat_rate > 0:
+            if self.last_key_frame == self.frames:
+                if self.repeated:
+                    return
+            elif now - self.last_key_time < 1000 / self.key_repeat_rate:
+                return
+            self.repeated = True
+
+        self.last_key, self.last_key_time, self.last_key_frame = identity, now, self.frames
+        self.post(events.KEY, key)
+
+input_stage = InputStage()
+# Where get_input() gets it from: the input_stage, or a replay.Player
+input_source = input_stage
+
+def launch(ev):
+    ev.data()
+    return True
+events.registry.subscribe(events.LAUNCH, launch)
+
+def get_input(wait=False, deadline=None):
+    """
+    Grab the mouse and all the key events from libtcod and {events.post} them
+    (see InputStage). If wait is True, block until there is at least one
+    event first, or until deadline (in game time), if given.
+    """
+    input_source.poll(wait, deadline)
+
+class Scene(object):
+    """
+    A widget tree on the scene stack (see push()). Only the top scene gets
+    input; a dialog scene is popped by an OK or CANCEL event, and on_result
+    (if any) is called with its data. on_close (if any) is called when the
+    scene leaves the stack, however that happens.
+
+    Scenes below an opaque scene are not drawn. Unless told otherwise, a
+    scene is opaque if its top widget covers the screen. The scenes that
+    show under the top one are only redrawn when the stack changes or they
+    are animating; otherwise what they last drew stays on the root console.
+    """
+    def __init__(self, top, dialog=False, opaque=None, on_result=None, on_close=None):
+        self.top = top
+        self.dialog = dialog
+        if opaque is None:
+            rect = top.rect
+            opaque = (rect.left <= 0 and rect.top <= 0 and
+                      rect.right >= tcod.root_console.width and rect.bottom >= tcod.root_console.height)
+        self.opaque = opaque
+        self.on_result = on_result
+        self.on_close = on_close
+        self.hits = widgets.HitIndex(top)
+
+    def close(self):
+        self.top.close()
+        if self.on_close:
+            self.on_close()
+
+class SceneStack(object):
+    def __init__(self):
+        self.scenes = []
+        self.changed = False # since the main loop last looked
+
+    def __len__(self):
+        return len(self.scenes)
+
+    @property
+    def top(self):
+        return self.scenes[-1] if self.scenes else None
+
+    def push(self, scene):
+        self.scenes.append(scene)
+        self.changed = True
+        return scene
+
+    def pop(self, scene, result=None):
+        """ Takes scene (and whatever is above it) off the stack, and hands it result. """
+        while scene in self.scenes:
+            popped = self.scenes.pop()
+            popped.close()
+            self.changed = True
+        if scene.on_result:
+            scene.on_result(result)
+
+    def clear(self):
+        while self.scenes:
+            self.scenes.pop().close()
+        self.changed = True
+
+    def visible(self):
+        """ The scenes to draw, bottom first: the topmost opaque one and those above it. """
+        scenes = self.scenes
+        for i in xrange(len(scenes) - 1, -1, -1):
+            if scenes[i].opaque:
+                return scenes[i:]
+        return scenes[:]
+
+scenes = SceneStack()
+
+def push(top, dialog=False, opaque=None, on_result=None, on_close=None):
+    """ Puts top on the scene stack (see Scene); the main loop takes it from there. """
+    return scenes.push(Scene(top, dialog, opaque, on_result, on_close))
+
+def is_idle(visible):
+    """
+    Nothing will change on screen until there is some input, the next timer
+    is due (see events.timers) or a background task wakes up: no events are
+    waiting to be handled, no jobs are running and no tasks can go on (input
+    would hold those up, so the loop keeps going while there are any) and
+    nothing is animating.
+    """
+    return (not events.pending() and not jobs.scheduler.pending and not tasks.loop.pending and
+            not animation.scheduler.active and not profiler.overlay.visible and
+            not any(scene.top.is_animating() for scene in visible))
+
+def next_deadline():
+    """ When the next timer is due or a sleeping task wakes up (in game time), or None. """
+    deadlines = [deadline for deadline in (events.timers.next_deadline(), tasks.loop.next_deadline())
+                 if deadline is not None]
+    return min(deadlines) if deadlines else None
 
 def main_loop(top, dialog=False):
-    while True:
-        top.render()
-        tcod.flush()
+    """
+    Pushes top as a scene, and runs the game's one loop until the scene
+    stack is empty or a QUIT comes along: draws the visible scenes and hands
+    the top one the events. Frames are drawn at the FPS limit only while
+    something is going on; when idle, the loop sleeps until the next input,
+    timer or background task wake-up.
+    Jobs (see jobs), then background tasks (see tasks) run in what is left
+    of each frame's frame_budget after that. Game time (events.game_clock)
+    starts when the loop does.
+
+    Called while the loop is already running, it only pushes the scene.
+    """
+    push(top, dialog)
+    if main_loop.running:
+        return
+    main_loop.running = True
+    events.game_clock.reset()
+    try:
+        _run()
+    finally:
+        main_loop.running = False
+        scenes.clear()
+main_loop.running = False
+
+def _run():
+    timer = profiler.profiler
+    overlay_visible = profiler.overlay.visible
+    while scenes:
+        frame_start = clock()
+        visible = scenes.visible()
+        redraw = scenes.changed or overlay_visible != profiler.overlay.visible
+        scenes.changed, overlay_visible = False, profiler.overlay.visible
+        with timer.phase('render'):
+            animation.scheduler.update()
+            for scene in visible[:-1]:
+                if redraw or scene.top.is_animating():
+                    scene.top.render()
+            visible[-1].top.render()
+            if profiler.overlay.visible:
+                profiler.overlay.render()
+        with timer.phase('flush'):
+            tcod.flush()
 
         # Get the input...
-        get_input()
-        if tcod.is_window_closed():
-            events.post(events.QUIT)
-
-        # ...and handle it:
-        for event in events.generator():
-            if event.type is events.QUIT:
-                # Repost the quit event to break out of all the loops.
+        with timer.phase('input'):
+            get_input(wait=is_idle(visible), deadline=next_deadline())
+            timer.idle(input_source.waited)
+            if tcod.is_window_closed():
                 events.post(events.QUIT)
-                return
-            elif dialog and event.type in {events.OK, events.CANCEL}:
-                return event.data
-            elif event.type is events.LAUNCH:
-                event.data()
-            else:
-                top.handle_event(event)
+            events.timers.poll()
+        timer.count('raw input', input_source.raw)
+        timer.count('posted input', input_source.posted)
+
+        # ...and hand it to the top scene:
+        with timer.phase('dispatch'):
+            for event in events.generator():
+                if event.type is events.QUIT:
+                    events.stats.handled(event, True)
+                    return
+                events.stats.handled(event, dispatch(scenes.top, event))
+                if not scenes:
+                    break
+
+        with timer.phase('jobs'):
+            jobs.scheduler.run(frame_start + frame_budget)
+        with timer.phase('tasks'):
+            tasks.loop.run(frame_start + frame_budget)
+        events.end_frame()
+        timer.end_frame()
+
+def dispatch(scene, event):
+    """
+    Offers event to everything that might want it, scene first: its
+    animations (a key press or a click skips them), its subscriptions, then
+    the widgets under the mouse or its tree. Only what the scene leaves goes
+    to the global subscriptions, so that e.g. a dialog can take the
+    profiler's keys. True if something handled it.
+    """
+    if scene.dialog and event.type in {events.OK, events.CANCEL}:
+        scenes.pop(scene, event.data)
+        return True
+    elif animation.handle_event(event, scene.top) or scene.top.subscriptions.dispatch(event):
+        return True
+    elif event.type is events.MOUSE:
+        handled = scene.hits.dispatch(event)
+    else: # What depends on focus or selection goes down the tree
+        handled = scene.top.handle_event(event)
+    return handled or events.registry.dispatch(event)
 
-def keybind_dialog():
+def keybind_dialog(on_result=None):
+    """ Asks for a key; on_result is given its name (or None if cancelled). """
     top = widgets.Dialog(width=40, height=3)
     top.center_in_console()
 
@@ -53,5 +332,5 @@ def keybind_dialog():
         return False
     l.handle_event = types.MethodType(label_event, l, widgets.Label)
 
-    return main_loop(top, dialog=True)
+    return push(top, dialog=True, on_result=on_result)
 
@@ -1,12 +1,16 @@
-import Queue
+import sys, math, logging, heapq, threading
+from bisect import insort
 from itertools import count
-from collections import namedtuple
+from collections import namedtuple, deque, defaultdict
+from timeit import default_timer as clock
+
+from game import utils
 
 counter = count()
 id = lambda: counter.next()
 
-# Events are handled by PriorityQueue, so the event type ID defines the order of
-# processing. This may turn out to be a bad thing.
+# Events are dispatched in order of their type ID (lowest first), and in the
+# order they were posted within a type.
 QUIT = id()
 MOUSE = id()
 KEY = id()
@@ -16,15 +20,363 @@ OK = id()
 CANCEL = id()
 APPLY = id()
 
-queue = Queue.PriorityQueue()
-Event = namedtuple("Event", ["type", "data"])
+names = {QUIT: "QUIT", MOUSE: "MOUSE", KEY: "KEY", LAUNCH: "LAUNCH",
+         OK: "OK", CANCEL: "CANCEL", APPLY: "APPLY"}
+
+# posted is the clock() time it was posted at
+Event = namedtuple("Event", ["type", "data", "posted"])
+Event.__new__.__defaults__ = (None,)
+
+log = logging.getLogger(__name__)
+
+class Dispatcher(object):
+    """
+    Holds posted events until they are dispatched: a deque per event type, so
+    posting is an append and events come out by draining the deques, lowest
+    type first. An event posted while draining is dispatched in the same pass
+    -- right away, if its type is lower than the one being drained.
+
+    post() is for the main thread only; other threads must use
+    post_threadsafe(), which goes through a separate inbox (deque appends and
+    pops are atomic) that is emptied into the deques whenever they are
+    drained. A thread that does should open_inbox() first and close_inbox()
+    when it is done: libtcod cannot be woken from waiting for input, so the
+    main loop only looks at the inbox while it waits (see
+    dialogs.InputStage) if the inbox is open.
+
+    Events are stamped when posted; if there are stats (see Stats), each is
+    timed from then until it is handed out. high_water is the most events
+    waiting at once since reset_high_water().
+    """
+    def __init__(self, stats=None):
+        self.queues = {}
+        self.types = []
+        self.inbox = deque()
+        self.inbox_writers = 0
+        self.inbox_lock = threading.Lock()
+        self.count = 0
+        self.high_water = 0
+        self.stats = stats
+        self.preempt = sys.maxint # the lowest type posted since draining started
+
+    def post(self, type, data=None):
+        self.append(Event(type, data, clock()))
+
+    def append(self, event):
+        type = event.type
+        try:
+            queue = self.queues[type]
+        except KeyError:
+            queue = self.queues[type] = deque()
+            insort(self.types, type)
+        queue.append(event)
+        self.count += 1
+        if self.count > self.high_water:
+            self.high_water = self.count
+        if type < self.preempt:
+            self.preempt = type
+
+    def post_threadsafe(self, type, data=None):
+        self.inbox.append(Event(type, data, clock()))
+
+    def open_inbox(self):
+        """ Says that a thread is going to post_threadsafe(), until it calls close_inbox(). """
+        with self.inbox_lock:
+            self.inbox_writers += 1
+
+    def close_inbox(self):
+        with self.inbox_lock:
+            self.inbox_writers -= 1
+
+    def pending(self):
+        return self.count > 0 or len(self.inbox) > 0
+
+    def collect_inbox(self):
+        inbox = self.inbox
+        while inbox:
+            self.append(inbox.popleft())
 
-def post(type, data=None):
-    queue.put(Event(type, data))
+    def reset_high_water(self):
+        """ Returns high_water, and starts over from the events waiting now. """
+        high_water, self.high_water = self.high_water, self.count
+        return high_water
 
-def generator():
-    try:
+    def drain(self):
+        """ Yields the waiting events, in dispatch order, until there are none. """
         while True:
-            yield queue.get(False)
-    except Queue.Empty:
-        raise StopIteration()
+            self.collect_inbox()
+            if not self.count:
+                return
+
+            for type in self.types:
+                queue = self.queues[type]
+                if queue:
+                    break
+
+            # Hand out this type's events until a lower type turns up
+            self.preempt = type
+            while queue and self.preempt >= type:
+                self.count -= 1
+                event = queue.popleft()
+                if self.stats:
+                    self.stats.dispatched(event)
+                yield event
+
+class GameClock(object):
+    """
+    Game time: seconds since the main loop started, as of the frame being
+    handled, in whole milliseconds. Timers, animations, key repeats and
+    sleeping tasks go by it rather than by clock(), so that all of a frame
+    sees the same time. The main loop's input source sets it once a frame,
+    once the input is in (see dialogs.InputStage) -- a replay.Player to the
+    time recorded for the frame, so that all of those go as they went then.
+    """
+    def __init__(self):
+        self.start = None
+        self.now = 0.0
+
+    @property
+    def milli(self):
+        return int(round(self.now * 1000))
+
+    def reset(self):
+        """ Starts game time (at 0) from now. """
+        self.start = clock()
+        self.now = 0.0
+
+    def elapsed(self):
+        """ The game time it is by now, which may be past the frame's. """
+        return clock() - self.start if self.start is not None else self.now
+
+    def tick(self, milli=None):
+        """ Sets the frame's time: to milli, or to the time it is. Returns it in milliseconds. """
+        if milli is None: # rounded up, so that a deadline waited for has come
+            milli = int(math.ceil(self.elapsed() * 1000))
+        self.now = milli / 1000.0
+        return milli
+
+class Timer(object):
+    """ An event to post at deadline (and then every interval seconds, if that is set). """
+    __slots__ = ('deadline', 'interval', 'type', 'data', 'cancelled')
+
+    def __init__(self, deadline, interval, type, data):
+        self.deadline = deadline
+        self.interval = interval
+        self.type = type
+        self.data = data
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Timers(object):
+    """
+    Events to post later, in a heap ordered by deadline (in game time, see
+    GameClock): poll() (once a frame, from the main loop) only looks at the
+    earliest deadline, unless it has come. Cancelled timers are dropped when
+    they reach the top.
+
+    A periodic timer that fell behind (the game was busy, or waiting for
+    input) posts once, and goes on from its next deadline after now. Like
+    post(), this is for the main thread only.
+    """
+    def __init__(self, dispatcher, clock):
+        self.dispatcher = dispatcher
+        self.clock = clock
+        self.heap = []
+        self.counter = count() # keeps timers with the same deadline in order
+
+    def post_after(self, delay, type, data=None):
+        """ Posts an event delay seconds from now; returns its Timer, to cancel() it. """
+        return self.add(Timer(self.clock.now + delay, None, type, data))
+
+    def every(self, interval, type, data=None):
+        """ Posts an event every interval seconds, starting interval seconds from now. """
+        return self.add(Timer(self.clock.now + interval, interval, type, data))
+
+    def add(self, timer):
+        heapq.heappush(self.heap, (timer.deadline, next(self.counter), timer))
+        return timer
+
+    def next_deadline(self):
+        """ When the next timer is due, or None if there is none. """
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def poll(self):
+        heap = self.heap
+        now = self.clock.now
+        if not heap or heap[0][0] > now:
+            return
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if timer.cancelled:
+                continue
+            self.dispatcher.post(timer.type, timer.data)
+            if timer.interval:
+                behind = int((now - timer.deadline) / timer.interval)
+                timer.deadline += (behind + 1) * timer.interval
+                self.add(timer)
+
+class TypeStats(object):
+    __slots__ = ('dispatched', 'handled', 'total_latency', 'max_latency')
+
+    def __init__(self):
+        self.dispatched = self.handled = 0
+        self.total_latency = self.max_latency = 0.0
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.dispatched if self.dispatched else 0.0
+
+class Stats(object):
+    """
+    What becomes of the events, by type: how many were dispatched, how long
+    they waited between being posted and dispatched, and how many something
+    handled (the main loop reports that, see handled()). Also keeps the most
+    events waiting at once in each of the last `history` frames.
+
+    If log_interval is set, end_frame() logs a summary() to the game.events
+    logger at most that often (in seconds).
+    """
+    def __init__(self, history=300, log_interval=0):
+        self.types = defaultdict(TypeStats)
+        self.depths = deque(maxlen=history)
+        self.log_interval = log_interval
+        self.last_log = clock()
+
+    def dispatched(self, event):
+        if event.posted is None:
+            return
+        latency = clock() - event.posted
+        stats = self.types[event.type]
+        stats.dispatched += 1
+        stats.total_latency += latency
+        if latency > stats.max_latency:
+            stats.max_latency = latency
+
+    def handled(self, event, handled):
+        if handled:
+            self.types[event.type].handled += 1
+
+    def end_frame(self, high_water):
+        self.depths.append(high_water)
+        if self.log_interval and clock() - self.last_log >= self.log_interval:
+            self.last_log = clock()
+            log.info("event stats:\n%s", self.summary())
+
+    def reset(self):
+        self.types.clear()
+        self.depths.clear()
+
+    def get_stats(self):
+        """
+        A dict of dicts of numbers (latencies in milliseconds): one per type
+        name, and 'queue' with the frames' high water marks. Events still
+        being handled (say, a LAUNCH whose dialog is open) count as unhandled.
+        """
+        result = {}
+        for type, stats in self.types.iteritems():
+            result[names.get(type, str(type))] = {
+                'dispatched': stats.dispatched,
+                'handled': stats.handled,
+                'unhandled': stats.dispatched - stats.handled,
+                'mean_latency': stats.mean_latency * 1000,
+                'max_latency': stats.max_latency * 1000,
+            }
+        depths = self.depths or [0]
+        result['queue'] = {
+            'high_water': max(depths),
+            'mean_high_water': float(sum(depths)) / len(depths),
+        }
+        return result
+
+    def summary(self):
+        stats = self.get_stats()
+        queue = stats.pop('queue')
+        lines = ["%-8s %8d dispatched, %8d unhandled, latency %7.3f ms mean, %7.3f ms worst" % (
+                    name, s['dispatched'], s['unhandled'], s['mean_latency'], s['max_latency'])
+                 for name, s in sorted(stats.iteritems())]
+        lines.append("queue depth: %(high_water)d at most, %(mean_high_water).1f per frame on average" % queue)
+        return "\n".join(lines)
+
+class Subscription(namedtuple("Subscription", ["type", "handler", "key", "region"])):
+    def matches(self, event):
+        """ Whether a mouse event is in the region (if any); types and keys are matched by the Registry. """
+        if self.region is None:
+            return True
+        return (self.region.left <= event.data.cx < self.region.right and
+                self.region.top <= event.data.cy < self.region.bottom)
+
+class Registry(object):
+    """
+    Handlers subscribed to events by type, optionally only for a key (by name,
+    see utils.name_key) or for mouse events within a region (anything with
+    left, top, right and bottom, e.g. a utils.Rect, looked at when an event
+    comes; only MOUSE subscriptions may have one). Handlers are called with
+    the event, the latest subscribed first, until one returns True; only the
+    subscriptions for the event's type (and key) are looked at.
+    """
+    def __init__(self):
+        self.by_type = defaultdict(list)
+        self.by_key = defaultdict(list)
+
+    def subscribe(self, type, handler, key=None, region=None):
+        """ Returns the Subscription, for unsubscribe(). """
+        if key is not None and utils.key_check(key) is None:
+            raise ValueError("Key '%s' does not appear to be a valid key!" % key)
+        if region is not None and type is not MOUSE:
+            raise ValueError("Only mouse events can be subscribed to by region, not %s" % names.get(type, type))
+        subscription = Subscription(type, handler, key, region)
+        if key is None:
+            self.by_type[type].append(subscription)
+        else:
+            self.by_key[(type, key)].append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription.key is None:
+            subscriptions = self.by_type.get(subscription.type)
+        else:
+            subscriptions = self.by_key.get((subscription.type, subscription.key))
+        if subscriptions and subscription in subscriptions:
+            subscriptions.remove(subscription)
+
+    def merge(self, other):
+        """ Moves the subscriptions of other into this registry, after its own. """
+        for type, subscriptions in other.by_type.iteritems():
+            self.by_type[type].extend(subscriptions)
+        for type_key, subscriptions in other.by_key.iteritems():
+            self.by_key[type_key].extend(subscriptions)
+        other.by_type.clear()
+        other.by_key.clear()
+
+    def dispatch(self, event):
+        """ Offers event to its subscribers; True if one of them handled it. """
+        if self.by_key and event.type is KEY:
+            for subscription in reversed(self.by_key.get((KEY, utils.name_key(event.data)), ())):
+                if subscription.handler(event):
+                    return True
+
+        for subscription in reversed(self.by_type.get(event.type, ())):
+            if subscription.matches(event) and subscription.handler(event):
+                return True
+        return False
+
+stats = Stats()
+dispatcher = Dispatcher(stats)
+registry = Registry()
+game_clock = GameClock()
+timers = Timers(dispatcher, game_clock)
+post_after = timers.post_after
+every = timers.every
+post = dispatcher.post
+post_threadsafe = dispatcher.post_threadsafe
+pending = dispatcher.pending
+generator = dispatcher.drain
+
+def end_frame():
+    """ Closes the frame's queue depth stats; for the main loop. """
+    stats.end_frame(dispatcher.reset_high_water())
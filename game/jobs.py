@@ -0,0 +1,124 @@
+"""
+Incremental work that must happen on the main thread (anything touching
+libtcod or widgets), spread over frames so that no frame hitches. A job is a
+generator that does a bit of the work between yields:
+
+    def draw_rows(console, rows):
+        for y, row in enumerate(rows):
+            console.print_ex(0, y, text=row)
+            yield
+
+    jobs.add(draw_rows(console, rows), priority=1, name="draw rows")
+
+The main loop runs jobs in the time its frame budget leaves after drawing
+and handling input (see dialogs.main_loop), the highest priority first.
+"""
+import sys, logging
+from collections import defaultdict
+from timeit import default_timer as clock
+
+log = logging.getLogger(__name__)
+
+class Job(object):
+    """ A generator being run by a JobScheduler, and the time it took so far. """
+    def __init__(self, generator, priority=0, name=None, on_done=None):
+        self.generator = generator
+        self.priority = priority
+        self.name = name or getattr(generator, '__name__', 'job')
+        self.on_done = on_done
+        self.steps = 0
+        self.time = 0.0
+        self.done = False
+        self.exc_info = None
+
+    @property
+    def mean_step(self):
+        return self.time / self.steps if self.steps else 0.0
+
+    def cancel(self):
+        if not self.done:
+            self.generator.close()
+            self.done = True
+
+    def step(self):
+        start = clock()
+        try:
+            next(self.generator)
+        except StopIteration:
+            self.done = True
+        except Exception:
+            self.exc_info = sys.exc_info()
+            self.done = True
+            log.exception("job %s failed", self.name)
+        finally:
+            self.time += clock() - start
+            self.steps += 1
+        if self.done and self.on_done:
+            self.on_done()
+
+class JobScheduler(object):
+    """
+    Runs jobs a step at a time, highest priority first (and, within a
+    priority, in the order they were added), until its deadline. A step is
+    not started if the job's steps take longer on average than the time
+    left, except that the first step of each run() always happens, so jobs
+    keep moving even when frames are full.
+
+    A job that raises is logged and dropped like one that finished (its
+    on_done still runs; the job keeps the exception in exc_info). Each
+    job's steps and time are added up per job name (see get_stats()).
+    """
+    def __init__(self):
+        self.jobs = []
+        self.totals = defaultdict(lambda: [0, 0, 0.0]) # name -> [jobs, steps, seconds] of finished jobs
+
+    def add(self, generator, priority=0, name=None, on_done=None):
+        job = Job(generator, priority, name, on_done)
+        # After the jobs of the same or a higher priority
+        index = len(self.jobs)
+        while index > 0 and self.jobs[index - 1].priority < priority:
+            index -= 1
+        self.jobs.insert(index, job)
+        return job
+
+    @property
+    def pending(self):
+        return any(not job.done for job in self.jobs)
+
+    def run(self, deadline):
+        first = True
+        while self.jobs:
+            job = self.jobs[0]
+            if not job.done:
+                if not first and clock() + job.mean_step > deadline:
+                    return
+                job.step()
+                first = False
+            if job.done:
+                self.jobs.pop(0)
+                totals = self.totals[job.name]
+                totals[0] += 1
+                totals[1] += job.steps
+                totals[2] += job.time
+
+    def get_stats(self):
+        """
+        {name: {'jobs', 'running', 'steps', 'time', 'mean_step'}}, with times
+        in milliseconds, for finished and running jobs.
+        """
+        totals = defaultdict(lambda: [0, 0, 0, 0.0])
+        for name, (count, steps, time) in self.totals.iteritems():
+            totals[name][0] += count
+            totals[name][2] += steps
+            totals[name][3] += time
+        for job in self.jobs:
+            totals[job.name][1] += 1
+            totals[job.name][2] += job.steps
+            totals[job.name][3] += job.time
+
+        return dict((name, {'jobs': count + running, 'running': running, 'steps': steps,
+                            'time': time * 1000, 'mean_step': time * 1000 / steps if steps else 0.0})
+                    for name, (count, running, steps, time) in totals.iteritems())
+
+scheduler = JobScheduler()
+add = scheduler.add
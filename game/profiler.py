@@ -0,0 +1,219 @@
+""" Frame timing: where does the time go? """
+import collections
+from contextlib import contextmanager
+from timeit import default_timer as clock
+
+import tcod
+from game import events, widgets, jobs
+
+# The overlay's keys, and where the dump key writes to
+TOGGLE_KEY = "F3"
+DUMP_KEY = "Shift+F3"
+DUMP_FILE = "profile.txt"
+
+# Upper bounds (in milliseconds) of the frame time histogram's buckets
+BUCKETS = (1, 2, 4, 8, 16, 33, 66, 100, 250, 1000)
+
+class Profiler(object):
+    """
+    Collects, per frame, the time spent in each phase of the main loop (see
+    phase()) and, while widget profiling is on, in each widget class's
+    render(). The last `history` frames are kept for the averages shown in
+    the overlay and for the histogram written by dump(). Time spent waiting
+    for input (see idle()) is kept apart: phases and totals only count work.
+    """
+    PHASES = ('render', 'flush', 'input', 'dispatch', 'jobs', 'tasks')
+
+    def __init__(self, history=300):
+        self.frames = collections.deque(maxlen=history)
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.widget_times = collections.defaultdict(float)
+        self.widget_counts = collections.defaultdict(int)
+        self.frame_count = 0
+        self.widget_frame_start = 0
+        self._frame_start = clock()
+        self._render_stack = []
+        self._wrapped = {}
+
+    def count(self, name, n=1):
+        """ Adds n to this frame's counter name. """
+        self.current[name] = self.current.get(name, 0) + n
+
+    def idle(self, seconds):
+        """ Notes seconds of this frame spent waiting, to leave out of its phase and total. """
+        self.current['idle'] = self.current.get('idle', 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = clock()
+        idle = self.current.get('idle', 0.0)
+        try:
+            yield
+        finally:
+            waited = self.current.get('idle', 0.0) - idle
+            self.current[name] = self.current.get(name, 0.0) + clock() - start - waited
+
+    def end_frame(self):
+        now = clock()
+        self.current['total'] = now - self._frame_start - self.current.get('idle', 0.0)
+        self.current['tcod'] = tcod.get_last_frame_length()
+        self.frames.append(self.current)
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self._frame_start = now
+        self.frame_count += 1
+
+    def averages(self):
+        """ Average milliseconds per frame for each phase, the total, and idle time. """
+        if not self.frames:
+            return {}
+        keys = self.PHASES + ('total', 'idle')
+        return dict((key, 1000 * sum(frame.get(key, 0.0) for frame in self.frames) / len(self.frames))
+                    for key in keys)
+
+    def histogram(self):
+        """ [(upper bound in ms, number of frames)] over the kept frames. """
+        counts = [0] * (len(BUCKETS) + 1)
+        for frame in self.frames:
+            ms = frame['total'] * 1000
+            for i, bound in enumerate(BUCKETS):
+                if ms < bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return zip(BUCKETS + (None,), counts)
+
+    def top_widgets(self, count=5):
+        """ The widget classes that took the most (self) render time, slowest first. """
+        ranked = sorted(self.widget_times.iteritems(), key=lambda item: item[1], reverse=True)
+        return ranked[:count]
+
+    @property
+    def profiling_widgets(self):
+        return bool(self._wrapped)
+
+    def profile_widgets(self, enable=True):
+        """
+        Wraps (or unwraps) the render() of every Widget subclass, so that each
+        class accumulates the time its widgets spend rendering, excluding their
+        children. Costs a little per render, so it is off by default.
+        """
+        if not enable:
+            for cls, render in self._wrapped.iteritems():
+                cls.render = render
+            self._wrapped.clear()
+            return
+
+        pending = [widgets.Widget]
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            if 'render' in cls.__dict__ and cls not in self._wrapped:
+                self._wrapped[cls] = cls.__dict__['render']
+                cls.render = self._timed(cls.__dict__['render'])
+        self.widget_times.clear()
+        self.widget_counts.clear()
+        self.widget_frame_start = self.frame_count
+
+    def _timed(self, render):
+        stack = self._render_stack
+        def timed_render(widget):
+            # super().render() calls are part of the same widget's render
+            if stack and stack[-1][0] is widget:
+                return render(widget)
+
+            stack.append([widget, 0.0])
+            start = clock()
+            try:
+                return render(widget)
+            finally:
+                elapsed = clock() - start
+                children = stack.pop()[1]
+                name = type(widget).__name__
+                self.widget_times[name] += elapsed - children
+                self.widget_counts[name] += 1
+                if stack:
+                    stack[-1][1] += elapsed
+        return timed_render
+
+    def dump(self, path):
+        """ Writes the phase averages, histogram and widget times to path. """
+        with open(path, 'w') as f:
+            f.write("%d frames profiled, %d kept\n\n" % (self.frame_count, len(self.frames)))
+            averages = self.averages()
+            for key in self.PHASES + ('total',):
+                f.write("%-10s %8.3f ms/frame\n" % (key, averages.get(key, 0.0)))
+            f.write("%-10s %8.3f ms/frame waiting for input, not in the above\n" % ('idle', averages.get('idle', 0.0)))
+            for key in ('raw input', 'posted input'):
+                total = sum(frame.get(key, 0) for frame in self.frames)
+                f.write("%-12s %6d events over the kept frames\n" % (key, total))
+
+            f.write("\nEvents:\n%s\n" % events.stats.summary())
+
+            f.write("\nFrame time histogram:\n")
+            low = 0
+            for bound, count in self.histogram():
+                label = "%d-%d ms" % (low, bound) if bound else ">= %d ms" % low
+                f.write("%-14s %6d %s\n" % (label, count, '#' * (60 * count / max(1, len(self.frames)))))
+                low = bound
+
+            job_stats = jobs.scheduler.get_stats()
+            if job_stats:
+                f.write("\nJobs:\n")
+                for name, s in sorted(job_stats.iteritems(), key=lambda item: item[1]['time'], reverse=True):
+                    f.write("%-20s %4d jobs (%d running), %6d steps, %10.3f ms total, %7.3f ms/step\n" % (
+                        name, s['jobs'], s['running'], s['steps'], s['time'], s['mean_step']))
+
+            if self.widget_times:
+                f.write("\nWidget render time (excluding children):\n")
+                for name, seconds in self.top_widgets(len(self.widget_times)):
+                    f.write("%-20s %10.3f ms total, %6d renders\n" % (name, seconds * 1000, self.widget_counts[name]))
+
+profiler = Profiler()
+
+class ProfilerOverlay(widgets.Widget):
+    """
+    Shows the profiler's numbers in the top right corner of the screen. It is
+    not part of any widget tree; the main loop renders it last when visible.
+    """
+    WIDTH = 30
+
+    def __init__(self, profiler):
+        super(ProfilerOverlay, self).__init__(width=self.WIDTH)
+        self.profiler = profiler
+        self.visible = False
+        self.fgcolor = tcod.color.LIGHT_GREY
+        self.bgcolor = tcod.color.DARKEST_GREY
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.profiler.profile_widgets(self.visible)
+
+    def lines(self):
+        averages = self.profiler.averages()
+        lines = ["FPS %d, last frame %.1f ms" % (tcod.get_fps(), tcod.get_last_frame_length() * 1000)]
+        lines.extend("%-9s %6.2f ms" % (key, averages.get(key, 0.0)) for key in Profiler.PHASES + ('total',))
+        if self.profiler.frames:
+            last = self.profiler.frames[-1]
+            lines.append("input: %d raw, %d posted" % (last.get('raw input', 0), last.get('posted input', 0)))
+        frames = max(1, self.profiler.frame_count - self.profiler.widget_frame_start)
+        lines.extend("%-16s %7.2f ms" % (name[:16], seconds * 1000 / frames)
+                     for name, seconds in self.profiler.top_widgets())
+        return lines
+
+    def render(self):
+        lines = self.lines()
+        self.rect.resize(height=len(lines))
+        self.rect.left = self.console.width - self.WIDTH
+
+        self.console.set_default_foreground(self.fgcolor)
+        self.console.set_default_background(self.bgcolor)
+        self.console.rect(self.rect.left, self.rect.top, self.rect.width, self.rect.height, clear=True)
+        for y, line in enumerate(lines):
+            self.console.print_ex(self.rect.left + 1, self.rect.top + y, tcod.background.SET, text=line)
+
+overlay = ProfilerOverlay(profiler)
+
+# The profiler's own keys: toggle the overlay, or dump to a file.
+events.registry.subscribe(events.KEY, lambda ev: overlay.toggle() or True, key=TOGGLE_KEY)
+events.registry.subscribe(events.KEY, lambda ev: profiler.dump(DUMP_FILE) or True, key=DUMP_KEY)
@@ -0,0 +1,135 @@
+"""
+Recording the input of a session and playing it back, frame for frame:
+
+    >>> dialogs.input_stage.recorder = replay.Recorder('session.rec')
+    >>> dialogs.input_source = replay.Player('session.rec')
+
+A recording is a header followed by records of the frame (main loop pass,
+counted from the start of the recording) they belong to, its game time in
+milliseconds (see events.GameClock) and their kind: one with the time of
+each frame, then one for each input event posted in it, with the tcod key or
+mouse it carried. Replaying the times along with the input makes timers,
+animations and key repeats go as they went when it was recorded, however
+fast it is replayed; only how much background work (jobs and tasks) fits in
+a frame still depends on the machine.
+"""
+import struct, time
+
+import tcod
+from game import events
+
+MAGIC = "NPREC\x00\x02\x00"
+
+# Record kinds
+KEY, MOUSE, END, FRAME = range(4)
+
+HEADER = struct.Struct("<IIB")           # frame, milliseconds, kind
+KEY_DATA = struct.Struct("<iB6?")        # vk, c, then the flags
+MOUSE_DATA = struct.Struct("<8i8?")      # coordinates, then the flags
+KEY_FIELDS = ('vk', 'c', 'pressed', 'lalt', 'lctrl', 'ralt', 'rctrl', 'shift')
+MOUSE_FIELDS = ('x', 'y', 'dx', 'dy', 'cx', 'cy', 'dcx', 'dcy',
+                'lbutton', 'rbutton', 'mbutton',
+                'lbutton_pressed', 'rbutton_pressed', 'mbutton_pressed',
+                'wheel_up', 'wheel_down')
+
+KINDS = {events.KEY: (KEY, KEY_DATA, KEY_FIELDS), events.MOUSE: (MOUSE, MOUSE_DATA, MOUSE_FIELDS)}
+TYPES = {KEY: events.KEY, MOUSE: events.MOUSE}
+
+class Recorder(object):
+    """
+    Writes the frame times and input events of an InputStage to a file (see
+    InputStage.recorder). close() is given how many frames were recorded,
+    so that a replay ends on the same frame.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def record_frame(self, frame, milli):
+        self.file.write(HEADER.pack(frame, milli, FRAME))
+
+    def record(self, frame, type, data):
+        kind, format, fields = KINDS[type]
+        self.file.write(HEADER.pack(frame, events.game_clock.milli, kind))
+        self.file.write(format.pack(*[getattr(data, name) for name in fields]))
+
+    def close(self, frames):
+        if self.file.closed:
+            return
+        self.file.write(HEADER.pack(max(frames - 1, 0), events.game_clock.milli, END))
+        self.file.close()
+
+def load(path):
+    """ The records of a recording, as (frame, milliseconds, kind, data); data is None but for KEY and MOUSE. """
+    with open(path, 'rb') as f:
+        buf = f.read()
+    if not buf.startswith(MAGIC):
+        if buf.startswith(MAGIC[:5]):
+            raise ValueError("%s is a recording of another version" % path)
+        raise ValueError("%s is not an input recording" % path)
+
+    records = []
+    offset = len(MAGIC)
+    while offset < len(buf):
+        frame, millis, kind = HEADER.unpack_from(buf, offset)
+        offset += HEADER.size
+        if kind in (END, FRAME):
+            records.append((frame, millis, kind, None))
+            if kind == END:
+                break
+            continue
+        _, format, fields = KINDS[TYPES[kind]]
+        data = tcod.libtcod.Key() if kind == KEY else tcod.libtcod.Mouse()
+        for name, value in zip(fields, format.unpack_from(buf, offset)):
+            setattr(data, name, value)
+        offset += format.size
+        records.append((frame, millis, kind, data))
+    return records
+
+class Player(object):
+    """
+    Stands in for the InputStage (see dialogs.input_source): each poll() is
+    a frame, sets the game time recorded for it and posts the events
+    recorded in it. Unless realtime, it never waits, neither for the
+    recorded time nor for input; what the window reports is thrown away
+    either way. Once the recording is over it posts QUIT. waited is how
+    long the last poll() waited for the recorded time.
+    """
+    def __init__(self, path, realtime=False):
+        self.records = load(path)
+        self.realtime = realtime
+        self.next = 0
+        self.frame = 0
+        self.start = None
+        self.raw = self.posted = 0
+        self.waited = 0.0
+
+    def poll(self, wait=False, deadline=None):
+        self.raw = self.posted = self.waited = 0
+        if self.start is None:
+            self.start = time.time()
+        while tcod.next_event(tcod.event.KEY_PRESS | tcod.event.MOUSE)[0]:
+            pass
+
+        records = self.records
+        if self.next >= len(records): # cut short, without an end record
+            events.post(events.QUIT)
+            return
+        while self.next < len(records) and records[self.next][0] <= self.frame:
+            frame, millis, kind, data = records[self.next]
+            self.next += 1
+            if kind == END:
+                events.post(events.QUIT)
+                return
+            elif kind == FRAME:
+                if self.realtime:
+                    delay = self.start + millis / 1000.0 - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                        self.waited += delay
+                events.game_clock.tick(millis)
+            else:
+                events.post(TYPES[kind], data)
+                self.raw += 1
+                self.posted += 1
+        self.frame += 1
@@ -0,0 +1,139 @@
+""" Running the world in the background, at its own pace. """
+import threading, time
+from collections import namedtuple, deque
+
+import numpy
+
+class Snapshot(namedtuple('Snapshot', ['tick', 'west', 'north', 'z', 'tiles'])):
+    """
+    The tile ids of an area of the world (west, north, on level z) as they
+    were after a tick. tiles is indexed [x][y] and read-only: a published
+    snapshot never changes, so the renderer may hold on to it for as long as
+    it likes.
+    """
+    def contains(self, x, y, z):
+        return (z == self.z and self.west <= x < self.west + self.tiles.shape[0] and
+                self.north <= y < self.north + self.tiles.shape[1])
+
+    @property
+    def area(self):
+        """ (west, north, z, width, height) """
+        return (self.west, self.north, self.z) + self.tiles.shape
+
+    def overlap(self, other):
+        """ The slices of self.tiles and other.tiles that show the same place, or None. """
+        if self.z != other.z:
+            return None
+        x0, y0 = max(self.west, other.west), max(self.north, other.north)
+        x1 = min(self.west + self.tiles.shape[0], other.west + other.tiles.shape[0])
+        y1 = min(self.north + self.tiles.shape[1], other.north + other.tiles.shape[1])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return ((slice(x0 - self.west, x1 - self.west), slice(y0 - self.north, y1 - self.north)),
+                (slice(x0 - other.west, x1 - other.west), slice(y0 - other.north, y1 - other.north)))
+
+class Simulation(object):
+    """
+    Ticks a world.World in a thread of its own, tick_rate times a second, so
+    a slow tick never holds up input or drawing. After each tick the area
+    asked for with watch() is copied out of the world into a new Snapshot,
+    while the previous one stays published; once it is complete it replaces
+    that one in self.snapshot.
+
+    It serves get_tiles() from the latest snapshot, so it can stand in for
+    the world as a MapView's tile source. version changes whenever a new
+    snapshot shows something different where it overlaps the previous one;
+    area_version whenever the snapshot covers another area (published_area)
+    -- what is new there has to be fetched, but what was already seen has
+    not changed unless version did too.
+    """
+    def __init__(self, world, tick_rate=10):
+        self.world = world
+        self.tick_length = 1.0 / tick_rate
+        self.area = None
+        self.snapshot = None
+        self.version = 0
+        self.area_version = 0
+        self.tick_times = deque(maxlen=100)
+        self.blank = world.tilemap.index('nothing')
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, west, north, z, width, height):
+        """ Sets the area of the world to publish, from the next tick on. """
+        self.area = (west, north, z, width, height)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="simulation")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        next_tick = time.time()
+        while not self._stop.is_set():
+            start = time.time()
+            self.step()
+            self.tick_times.append(time.time() - start)
+
+            next_tick += self.tick_length
+            delay = next_tick - time.time()
+            if delay > 0:
+                self._stop.wait(delay)
+            else: # Running late: carry on from now rather than rush to catch up
+                next_tick = time.time()
+
+    def step(self):
+        self.world.tick()
+        self.publish()
+
+    def publish(self):
+        area = self.area
+        if area is None:
+            return
+
+        west, north, z, width, height = area
+        tiles = self.world.get_tiles(west, north, z, width, height)
+        tiles.flags.writeable = False
+
+        previous = self.snapshot
+        snapshot = self.snapshot = Snapshot(self.world.ticks, west, north, z, tiles)
+        if previous is None:
+            self.version += 1
+            self.area_version += 1
+            return
+
+        if previous.area != snapshot.area:
+            self.area_version += 1
+        overlap = previous.overlap(snapshot)
+        if overlap is not None and not numpy.array_equal(previous.tiles[overlap[0]], tiles[overlap[1]]):
+            self.version += 1
+
+    @property
+    def published_area(self):
+        """ The (west, north, z, width, height) of the latest snapshot, or None. """
+        snapshot = self.snapshot
+        return snapshot.area if snapshot else None
+
+    def get_tiles(self, west, north, z, width, height):
+        """ Like World.get_tiles(), but from the latest snapshot; blank outside it. """
+        result = numpy.empty((width, height), dtype=numpy.int16)
+        result[:] = self.blank
+
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.z != z:
+            return result
+
+        x0, y0 = max(west, snapshot.west), max(north, snapshot.north)
+        x1 = min(west + width, snapshot.west + snapshot.tiles.shape[0])
+        y1 = min(north + height, snapshot.north + snapshot.tiles.shape[1])
+        if x0 < x1 and y0 < y1:
+            result[x0-west:x1-west, y0-north:y1-north] = \
+                snapshot.tiles[x0-snapshot.west:x1-snapshot.west, y0-snapshot.north:y1-snapshot.north]
+        return result
@@ -0,0 +1,202 @@
+"""
+Cooperative background tasks, run by the main loop in the time left over
+in each frame (see dialogs.main_loop). A task is a generator; what it yields
+says what it waits for before it goes on:
+
+    def autosave(world):
+        data = yield tasks.run_in_executor(serialize, world) # sent back in
+        yield tasks.sleep(60)
+        yield                                                # just a break
+
+    tasks.spawn(autosave(the_world))
+
+Yielding a Future (run_in_executor() hands the call to a worker thread and
+returns one) resumes the task with its result, or raises its exception in
+the task; yielding a Task waits for it to finish. Tasks themselves only run
+on the main thread, between frames, so they may touch libtcod and widgets.
+"""
+import sys, logging, threading, Queue
+from collections import deque
+from timeit import default_timer as clock
+
+from game import events
+
+log = logging.getLogger(__name__)
+
+class Future(object):
+    """ The result of a call made elsewhere (e.g. in an Executor's thread), once it is done. """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._done.set()
+
+    def result(self):
+        """ The result; raises the call's exception if it failed. Blocks until done. """
+        self._done.wait()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+class Executor(object):
+    """
+    Runs blocking calls (file I/O, mostly) in a few worker threads, which are
+    started on the first submit(). The calls must leave libtcod alone.
+    """
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.queue = Queue.Queue()
+        self.threads = []
+
+    def submit(self, fn, *args, **kwargs):
+        if not self.threads:
+            for i in xrange(self.workers):
+                thread = threading.Thread(target=self.work, name="executor-%d" % i)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+        future = Future()
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    def work(self):
+        while True:
+            future, fn, args, kwargs = self.queue.get()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+class Sleep(object):
+    """ Done once seconds of game time (see events.GameClock) have gone by. """
+    __slots__ = ('deadline',)
+
+    def __init__(self, seconds):
+        self.deadline = events.game_clock.now + seconds
+
+    def done(self):
+        return events.game_clock.now >= self.deadline
+
+class Task(object):
+    """ A generator being run by a TaskLoop, and what it is waiting for. """
+    def __init__(self, generator):
+        self.generator = generator
+        self.waiting_on = None
+        self.finished = False
+        self.cancelled = False
+        self.exc_info = None
+
+    def done(self):
+        return self.finished
+
+    def cancel(self):
+        if not self.finished:
+            self.cancelled = True
+            self.generator.close()
+            self.finished = True
+
+    def ready(self):
+        waiting_on = self.waiting_on
+        return waiting_on is None or waiting_on.done()
+
+    def step(self):
+        """
+        Resumes the generator with what it waited for, up to its next yield.
+        Yielding anything but None, a Future, a Task or a Sleep fails the task.
+        """
+        waiting_on, self.waiting_on = self.waiting_on, None
+        try:
+            if isinstance(waiting_on, Future):
+                try:
+                    value = waiting_on.result()
+                except Exception:
+                    waiting_on = self.generator.throw(*sys.exc_info())
+                else:
+                    waiting_on = self.generator.send(value)
+            elif isinstance(waiting_on, Task) and waiting_on.exc_info:
+                waiting_on = self.generator.throw(*waiting_on.exc_info)
+            else:
+                waiting_on = next(self.generator)
+
+            if waiting_on is not None and not isinstance(waiting_on, (Future, Task, Sleep)):
+                self.generator.close()
+                raise TypeError("a background task can only wait for a Future, Task or Sleep, not %r"
+                                % (waiting_on,))
+            self.waiting_on = waiting_on
+        except StopIteration:
+            self.finished = True
+        except Exception:
+            self.exc_info = sys.exc_info()
+            self.finished = True
+            log.exception("background task %r failed", self.generator)
+
+class TaskLoop(object):
+    """
+    Runs tasks round-robin, a step at a time: run() goes on while there is
+    time before its deadline and a task that is not waiting. Every ready
+    task gets at least one step per run(), so a busy screen slows tasks down
+    but does not stop them.
+    """
+    def __init__(self):
+        self.tasks = deque()
+
+    def spawn(self, generator):
+        task = Task(generator)
+        self.tasks.append(task)
+        return task
+
+    @property
+    def pending(self):
+        """ Whether a task can go on now, rather than sleep or wait. """
+        return any(task.ready() for task in self.tasks if not task.finished)
+
+    @property
+    def waiting(self):
+        """ Whether a task waits for a call done elsewhere (a Future), which may end at any time. """
+        return any(isinstance(task.waiting_on, Future) and not task.waiting_on.done()
+                   for task in self.tasks if not task.finished)
+
+    def next_deadline(self):
+        """ When the first sleeping task wakes up (in game time), or None if none sleeps. """
+        deadlines = [task.waiting_on.deadline for task in self.tasks
+                     if isinstance(task.waiting_on, Sleep) and not task.finished]
+        return min(deadlines) if deadlines else None
+
+    def run(self, deadline):
+        tasks = self.tasks
+        first_pass = True
+        while tasks:
+            stepped = False
+            for i in xrange(len(tasks)):
+                task = tasks.popleft()
+                if task.finished:
+                    continue
+                if task.ready() and (first_pass or clock() < deadline):
+                    task.step()
+                    stepped = True
+                if not task.finished:
+                    tasks.append(task)
+            first_pass = False
+            if not stepped or clock() >= deadline:
+                return
+
+loop = TaskLoop()
+executor = Executor()
+
+spawn = loop.spawn
+sleep = Sleep
+
+def run_in_executor(fn, *args, **kwargs):
+    """ Calls fn in a worker thread; returns a Future for a task to yield. """
+    return executor.submit(fn, *args, **kwargs)
@@ -1,4 +1,4 @@
-from collections import namedtuple, MutableSet
+from collections import namedtuple, defaultdict, MutableSet
 import sys, time, string
 
 import tcod
@@ -10,22 +10,72 @@ class Rect(object):
     """
     Stores a rectangle and provides easy access to its top, left, right, and
     bottom coordinates, as well as its width and height.
+
+    Whenever the rectangle moves or changes size, every callable in
+    self.listeners is called (with no arguments).
     """
     def __init__(self, x=0, y=0, width=0, height=0):
         """ Note: Actually uses move_to and resize. """
-        self.left = self.top = self.width = self.height = 0
+        self.listeners = []
+        self._left = self._top = self._width = self._height = 0
 
         self.move_to(x, y)
         self.resize(width, height)
 
+    def changed(self):
+        for listener in self.listeners:
+            listener()
+
+    @property
+    def left(self):
+        return self._left
+
+    @left.setter
+    def left(self, value):
+        if value != self._left:
+            self._left = value
+            self.changed()
+
+    @property
+    def top(self):
+        return self._top
+
+    @top.setter
+    def top(self, value):
+        if value != self._top:
+            self._top = value
+            self.changed()
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, value):
+        if value != self._width:
+            self._width = value
+            self.changed()
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, value):
+        if value != self._height:
+            self._height = value
+            self.changed()
+
     def move_to(self, x=None, y=None):
         if x is None:
-            x = self.left
+            x = self._left
         if y is None:
-            y = self.top
+            y = self._top
 
-        self.left = x
-        self.top = y
+        if (x, y) != (self._left, self._top):
+            self._left = x
+            self._top = y
+            self.changed()
 
     def move_to_point(self, point):
         """ Same as move_to, but using a Point """
@@ -33,12 +83,14 @@ class Rect(object):
 
     def resize(self, width=None, height=None):
         if width is None:
-            width = self.width
+            width = self._width
         if height is None:
-            height = self.height
+            height = self._height
 
-        self.width = width
-        self.height = height
+        if (width, height) != (self._width, self._height):
+            self._width = width
+            self._height = height
+            self.changed()
 
     @property
     def right(self):
@@ -79,6 +131,55 @@ class Rect(object):
         return "Rect(x=%d, y=%d, width=%d, height=%d)" % (self.left, self.top, self.width, self.height)
 
 
+class GridIndex(object):
+    """
+    A spatial index of rectangles: the plane is cut into square buckets of
+    bucket_size, each remembering the items whose rectangles touch it, so that
+    finding the items at a point only looks through a single bucket.
+    """
+    def __init__(self, bucket_size=8):
+        self.bucket_size = bucket_size
+        self.buckets = defaultdict(set)
+        self.bounds = {}
+
+    def _keys(self, left, top, right, bottom):
+        size = self.bucket_size
+        for bx in xrange(left // size, (right - 1) // size + 1):
+            for by in xrange(top // size, (bottom - 1) // size + 1):
+                yield (bx, by)
+
+    def insert(self, item, rect):
+        """ Adds item, or moves it if it is already indexed. """
+        self.remove(item)
+        if rect.width < 1 or rect.height < 1:
+            return
+
+        bounds = self.bounds[item] = (rect.left, rect.top, rect.right, rect.bottom)
+        for key in self._keys(*bounds):
+            self.buckets[key].add(item)
+
+    def remove(self, item):
+        bounds = self.bounds.pop(item, None)
+        if bounds is None:
+            return
+
+        for key in self._keys(*bounds):
+            bucket = self.buckets[key]
+            bucket.discard(item)
+            if not bucket:
+                del self.buckets[key]
+
+    def query(self, x, y):
+        """ The items whose rectangles contain the point (x, y), in no particular order. """
+        bucket = self.buckets.get((x // self.bucket_size, y // self.bucket_size), ())
+        return [item for item in bucket
+                if self.bounds[item][0] <= x < self.bounds[item][2] and
+                   self.bounds[item][1] <= y < self.bounds[item][3]]
+
+    def __len__(self):
+        return len(self.bounds)
+
+
 class OrderedSet(MutableSet):
     """ Lovingly taken from http://code.activestate.com/recipes/576694/ """
     def __init__(self, iterable=None):
@@ -138,8 +239,13 @@ class OrderedSet(MutableSet):
         return set(self) == set(other)
 
 
+# Key names: vkeys and chars map them to checks (callables taking a key);
+# vkey_names and char_names map keys' (vk, shift) and c back to names.
 vkeys = {}
 chars = {}
+vkey_codes = {}
+vkey_names = {}
+char_names = {}
 
 def key_vk(vk):
     return lambda k: not k.shift and k.vk == vk
@@ -181,21 +287,25 @@ for name, vk in tcod.key.__dict__.items():
         name = name.capitalize()
     vkeys[name] = key_vk(vk)
     vkeys["Shift+"+name] = key_vk_shift(vk)
+    vkey_codes[name] = (vk, False)
+    vkey_codes["Shift+"+name] = (vk, True)
 
 for s in string.digits, string.letters, string.punctuation:
     for ch in s:
         chars[ch] = key_c(ch)
+        char_names[ord(ch)] = ch
+
+# Where several names share a key, the first one in vkeys wins
+for name in vkeys:
+    vkey_names.setdefault(vkey_codes[name], name)
 
 def key_check(name):
-    if vkeys[name]:
-        return vkeys[name]
-    elif chars[name]:
-        return chars[name]
+    return vkeys.get(name) or chars.get(name)
 
 def name_key(key):
-    for name, check in vkeys.iteritems():
-        if check(key):
-            return name
-    for name, check in chars.iteritems():
-        if check(key):
-            return name
+    """ The name of key (vkeys first, then chars), or None. """
+    name = vkey_names.get((key.vk, bool(key.shift)))
+    if name is None:
+        name = char_names.get(key.c)
+    return name
+
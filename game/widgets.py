@@ -1,5 +1,8 @@
 """ User Interface bits and widgets """
 import collections
+import itertools
+
+import numpy
 
 import tcod
 from game import events, utils
@@ -13,7 +16,9 @@ class Widget(object):
     asks its children to render themselves. Widgets may receive events; if an
     event is handled by a widget, it should return True. Otherwise, the event
     should be pased along to children, returning True if one of the children
-    handled it, or False otherwise.
+    handled it, or False otherwise. Mouse events are the exception: they are
+    routed by position (see HitIndex) straight to handle_mouse() of the
+    widgets under the cursor.
 
     Widgets who are initialized knowing who their parent is will automatically
     register themselves with their parent.
@@ -24,17 +29,28 @@ class Widget(object):
     console is will assume it is tcod.root_console.
 
     Coordinates (in self.rect) are parent-relative (unless there's no parent,
-    in which case, they are console-relative).
+    in which case, they are console-relative). The console-relative position
+    is cached in self.screen_origin and self.screen_rect, and recalculated
+    only after this widget or one of its parents moves or is resized.
+
+    A widget whose appearance changes on its own (i.e. not in response to an
+    event) should set self.animating while it does, so that the main loop
+    keeps rendering frames instead of waiting for input -- or, better, be
+    animated by tweens from game.animation, which the main loop knows about.
     """
 
     def __init__(self, parent=None, console=None, x=0, y=0, width=0, height=0, color_set=None, handlers=None):
         self.parent = parent
         self.child_dict = collections.OrderedDict()
         self.children = self.child_dict.viewkeys()
+        self._screen_origin = self._screen_rect = None
+        self.hit_index = None
+        self._subscriptions = None
         self.console = console
         self.fgcolor = tcod.color.WHITE
         self.bgcolor = tcod.color.BLACK
         self.color_set = color_set
+        self.animating = False
         self.handlers = handlers
         if self.handlers is None:
             self.handlers = {}
@@ -48,35 +64,104 @@ class Widget(object):
             self.console = tcod.root_console
 
         self.rect = utils.Rect(x, y, width, height)
+        self.rect.listeners.append(self.invalidate_layout)
+
+    @property
+    def root(self):
+        widget = self
+        while widget.parent:
+            widget = widget.parent
+        return widget
+
+    @property
+    def subscriptions(self):
+        """
+        The events.Registry of this widget's tree (it belongs to the root):
+        the main loop offers events to it before handing them down the tree,
+        which remains the way for events that depend on focus or selection.
+        When a root joins another tree, its subscriptions move to that tree's.
+        """
+        root = self.root
+        if root._subscriptions is None:
+            root._subscriptions = events.Registry()
+        return root._subscriptions
+
+    def subscribe(self, type, handler, key=None, region=None):
+        """ Subscribes handler to events of type; see events.Registry. """
+        return self.subscriptions.subscribe(type, handler, key, region)
 
     def register_child(self, child):
         child.parent = self
+        if child._subscriptions is not None:
+            self.subscriptions.merge(child._subscriptions)
+            child._subscriptions = None
         self.child_dict[child] = None
+        child.invalidate_layout()
+        if self.hit_index:
+            self.hit_index.add(child)
+
+    def invalidate_layout(self):
+        """ Forgets the cached screen position of this widget and its children. """
+        if self._screen_origin is None and self._screen_rect is None:
+            return # Nothing cached here, so nothing cached below either.
+
+        self._screen_origin = self._screen_rect = None
+        if self.hit_index:
+            self.hit_index.dirty.add(self)
+        for child in self.children:
+            child.invalidate_layout()
 
-    def point_to_screen(self, point):
-        """ Translates a Point(x,y) inside this widget into screen coordinates """
-        x, y = point
-
-        x += self.rect.left
-        y += self.rect.top
+    @property
+    def screen_origin(self):
+        """ The screen coordinates of this widget's top left corner, as a Point. """
+        if self._screen_origin is None:
+            self._screen_origin = self.calc_screen_origin()
+        return self._screen_origin
 
+    @property
+    def screen_rect(self):
+        """ self.rect, in screen coordinates. Do not modify it. """
+        if self._screen_rect is None:
+            x, y = self.screen_origin
+            self._screen_rect = utils.Rect(x, y, self.rect.width, self.rect.height)
+        return self._screen_rect
+
+    def calc_screen_origin(self):
         if self.parent:
-            return self.parent.point_to_screen(utils.Point(x,y))
+            x, y = self.parent.screen_origin
+            return utils.Point(x + self.rect.left, y + self.rect.top)
         else:
-            return utils.Point(x,y)
+            return utils.Point(self.rect.left, self.rect.top)
+
+    def point_to_screen(self, point):
+        """ Translates a Point(x,y) inside this widget into screen coordinates """
+        x, y = self.screen_origin
+        return utils.Point(point.x + x, point.y + y)
 
     def screen_to_point(self, point):
         """
         Translates a Point(x,y) in screen coordinates into a point inside this
         widget. Inverse of self.point_to_screen().
         """
-        x = point.x - self.rect.left
-        y = point.y - self.rect.top
+        x, y = self.screen_origin
+        return utils.Point(point.x - x, point.y - y)
 
-        if self.parent:
-            return self.parent.screen_to_point(utils.Point(x,y))
-        else:
-            return utils.Point(x,y)
+    def is_animating(self):
+        """ True if this widget or any of its children is animating. """
+        if self.animating:
+            return True
+        for child in self.children:
+            if child.is_animating():
+                return True
+        return False
+
+    def close(self):
+        """
+        Gives back what this widget and its children hold on to (offscreen
+        consoles, mostly) once they will not be rendered again.
+        """
+        for child in self.children:
+            child.close()
 
     def render(self):
         """ The default implementation just asks children to render. """
@@ -94,6 +179,14 @@ class Widget(object):
 
         return False
 
+    def handle_mouse(self, ev):
+        """
+        Called with mouse events over this widget (children first, if they are
+        also under the cursor). Return True if the event was handled, to keep
+        it from the widgets below. The default implementation ignores it.
+        """
+        return False
+
     def center_in_parent(self, horizontal=True, vertical=True):
         if self.parent is None:
             raise ValueError("Widget trying to center in non-existent parent")
@@ -108,13 +201,76 @@ class Widget(object):
         if vertical:
             self.rect.top = (self.console.height - self.rect.height) / 2
 
+class HitIndex(object):
+    """
+    Finds the widgets under a screen position, for routing mouse events. The
+    screen rects of all the widgets under root (that draw on root's console;
+    e.g. List items are their List's business) are kept in a utils.GridIndex.
+    Widgets that move, resize or are added are (re-)indexed the next time the
+    index is used.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.grid = utils.GridIndex()
+        self.dirty = set()
+        self.order = None
+        self.add(root)
+
+    def add(self, widget):
+        """ Indexes widget and its children. """
+        pending = [widget]
+        while pending:
+            widget = pending.pop()
+            if widget.console is not self.root.console:
+                continue
+            widget.hit_index = self
+            self.dirty.add(widget)
+            pending.extend(widget.children)
+        self.order = None
+
+    def update(self):
+        for widget in self.dirty:
+            self.grid.insert(widget, widget.screen_rect)
+        self.dirty.clear()
+
+        if self.order is None:
+            # Children are drawn over their parent, later siblings over earlier ones
+            self.order = {}
+            pending = [self.root]
+            while pending:
+                widget = pending.pop()
+                self.order[widget] = len(self.order)
+                pending.extend(reversed(list(widget.children)))
+
+    def widgets_at(self, x, y):
+        """ The widgets containing the screen position (x, y), topmost first. """
+        self.update()
+        hits = self.grid.query(x, y)
+        hits.sort(key=self.order.get, reverse=True)
+        return hits
+
+    def dispatch(self, ev):
+        """ Offers a mouse event to the widgets under it, topmost first. """
+        for widget in self.widgets_at(ev.data.cx, ev.data.cy):
+            if widget.handle_mouse(ev):
+                return True
+        return False
+
 class Image(Widget):
+    """
+    Draws the image file at path (two pixels per cell), cut down to the
+    widget's size if it has one. Images come from tcod.image_cache, which
+    also keeps them pre-rendered.
+    """
     def __init__(self, path, parent=None, console=None, x=0, y=0, width=0, height=0):
         super(Image, self).__init__(parent, console, x, y, width, height)
-        self.image = tcod.ImageFile(path)
+        self.path = path
+        self.image = tcod.image_cache.load(path)
 
     def render(self):
-        self.image.blit_2x(self.console)
+        origin = self.screen_origin
+        rendered = tcod.image_cache.render(self.path, self.rect.width, self.rect.height)
+        rendered.blit(dest_console=self.console, dest_x=origin.x, dest_y=origin.y)
         super(Image, self).render()
 
 class Label(Widget):
@@ -144,16 +300,15 @@ class Label(Widget):
         width = self.rect.width
         if self.max_width < 1:
             width = min(len(text), self.console.width - self.rect.left)
-        height = self.console.get_height_rect(self.rect.left, self.rect.top,
-                                              width, text=self._text)
-        self.rect.resize(width=width, height=height)
+        self.layout = tcod.layout_text(self._text, width, self.color_set)
+        self.rect.resize(width=width, height=self.layout.height)
 
     def render(self):
         if self.color_set:
             self.color_set.set_colors(0, self.fgcolor, self.bgcolor)
             self.color_set.apply()
 
-        x,y = self.point_to_screen(utils.origin)
+        x, y = self.screen_origin
 
         self.console.set_default_foreground(self.fgcolor)
         self.console.set_default_background(self.bgcolor)
@@ -170,11 +325,13 @@ class Button(Widget):
                  action=None, color_set=None):
         super(Button, self).__init__(parent, console, x, y, width, height=1, color_set=color_set)
 
-        self.key_check = utils.key_check(key)
-        if self.key_check is None:
+        self.key = key
+        if utils.key_check(key) is None:
             raise ValueError("Key '%s' does not appear to be a valid key!" % key)
 
         self.handlers['activate'] = action
+        if action:
+            self.subscribe(events.KEY, self.on_key, key=key)
 
         if self.color_set is None:
             self.color_set = button_cs
@@ -192,7 +349,7 @@ class Button(Widget):
         self.color_set.apply()
 
         self.console.set_default_background(self.bgcolor)
-        origin = self.point_to_screen(utils.origin)
+        origin = self.screen_origin
         self.console.rect(origin.x, origin.y, width=self.rect.width, height=1)
 
         super(Button, self).render()
@@ -201,13 +358,15 @@ class Button(Widget):
         self.console.put_char(origin.x, origin.y, '[')
         self.console.put_char(origin.x + self.rect.width - 1, origin.y, ']')
 
-    def handle_event(self, ev):
-        if ev.type is events.KEY and self.key_check(ev.data):
-            if 'activate' in self.handlers:
-                self.handlers['activate']()
-                return True
+    def on_key(self, ev):
+        self.handlers['activate']()
+        return True
 
-        super(Button, self).handle_event(ev)
+    def handle_mouse(self, ev):
+        if ev.data.lbutton_pressed and self.handlers.get('activate'):
+            self.handlers['activate']()
+            return True
+        return False
 
 class ListItem(Label):
     def __init__(self, parent, label, disabled=False, on_activate=None):
@@ -220,11 +379,9 @@ class ListItem(Label):
 
         self.handlers['activate'] = on_activate
 
-    def point_to_screen(self, point):
-        x = point.x + self.rect.left
-        y = point.y + self.rect.top
-
-        return utils.Point(x,y)
+    def calc_screen_origin(self):
+        # List items live in their list's sub_console, not on the screen
+        return utils.Point(self.rect.left, self.rect.top)
 
     def calc_size(self):
         super(ListItem, self).calc_size()
@@ -232,8 +389,8 @@ class ListItem(Label):
 
     def handle_event(self, ev):
         if ev.type == events.KEY and ev.data.vk == tcod.key.ENTER:
-            if 'activate' in self.handlers:
-                print self.handlers['activate'](self)
+            if self.handlers['activate']:
+                self.handlers['activate'](self)
             return True
 
         return super(ListItem, self).handle_event(ev)
@@ -259,11 +416,17 @@ class OptionsListItem(ListItem):
 
     def handle_event(self, ev):
         if self.handlers['event'](ev):
-            self.text = self.handlers['dynamic_text']()
             return True
 
         return super(OptionsListItem, self).handle_event(ev)
 
+    def render(self):
+        # The option may change after its event, e.g. when a dialog it opened closes
+        text = self.handlers['dynamic_text']()
+        if text != self.text:
+            self.text = text
+        super(OptionsListItem, self).render()
+
 class List(Widget):
     def __init__(self, parent=None, console=None, x=0, y=0, width=0, height=0, color_set=None):
         super(List, self).__init__(parent, console, x, y, 0, 0, color_set=color_set)
@@ -276,6 +439,10 @@ class List(Widget):
         self.disabled_fgcolor = tcod.color.DARK_GREY
         self.last_child = None
 
+    def close(self):
+        self.sub_console.close()
+        super(List, self).close()
+
     def register_child(self, child):
         self.last_child = child
 
@@ -335,7 +502,7 @@ class List(Widget):
         if self.color_set:
             self.color_set.apply()
 
-        origin = self.point_to_screen(utils.origin)
+        origin = self.screen_origin
         self.console.rect(origin.x, origin.y, draw_width, draw_height, clear=True)
 
         self.sub_console.set_default_background(self.bgcolor)
@@ -372,6 +539,417 @@ class List(Widget):
 
         return super(List, self).handle_event(ev)
 
+    def handle_mouse(self, ev):
+        """ A click selects the item under the cursor. """
+        if not ev.data.lbutton_pressed:
+            return False
+
+        y = ev.data.cy - self.screen_origin.y + self.scroll_top
+        for child in self.children:
+            if child.rect.top <= y < child.rect.bottom:
+                if not child.disabled:
+                    self.selected_item = child
+                return True
+        return False
+
+class VirtualList(Widget):
+    """
+    A list of single-line rows pulled from a data source -- anything with
+    __len__ and __getitem__ -- as they come into view, instead of a ListItem
+    per row: only the visible rows are ever laid out or drawn, so a list of a
+    hundred thousand entries costs no more per frame than one of ten.
+
+    handlers['label'] turns a row of the source into its text (str by
+    default); handlers['activate'] is called with the list and the selected
+    index when ENTER is pressed. The source is read afresh on each render, so
+    it may grow or shrink (call clamp_selection() if it shrank).
+    """
+    def __init__(self, source, parent=None, console=None, x=0, y=0, width=0, height=0,
+                 color_set=None, on_activate=None):
+        super(VirtualList, self).__init__(parent, console, x, y, width, height, color_set=color_set)
+        self.source = source
+        self.selected = 0
+        self.scroll_top = 0
+        self.selected_bgcolor = tcod.color.AZURE
+        self.scrollbar_bgcolor = tcod.color.GREY
+        self.handlers['label'] = str
+        self.handlers['activate'] = on_activate
+
+    @property
+    def page_size(self):
+        return max(1, self.rect.height)
+
+    def clamp_selection(self):
+        self.select(self.selected)
+
+    def select(self, index):
+        """ Selects row index (clamped to the source), scrolling it into view. """
+        self.selected = max(0, min(index, len(self.source) - 1))
+        if self.selected < self.scroll_top:
+            self.scroll_top = self.selected
+        elif self.selected >= self.scroll_top + self.page_size:
+            self.scroll_top = self.selected - self.page_size + 1
+
+    def scroll_by(self, amount):
+        last_top = max(0, len(self.source) - self.page_size)
+        self.scroll_top = max(0, min(self.scroll_top + amount, last_top))
+
+    def render(self):
+        if self.color_set:
+            self.color_set.set_colors(0, self.fgcolor, self.bgcolor)
+            self.color_set.apply()
+
+        x, y = self.screen_origin
+        count = len(self.source)
+        text_width = self.rect.width - 1 # the last column is for the scrollbar
+
+        self.console.set_default_foreground(self.fgcolor)
+        self.console.set_default_background(self.bgcolor)
+        self.console.rect(x, y, self.rect.width, self.rect.height, clear=True)
+
+        label = self.handlers['label']
+        for row in xrange(self.scroll_top, min(count, self.scroll_top + self.rect.height)):
+            if row == self.selected:
+                self.console.set_default_background(self.selected_bgcolor)
+                self.console.rect(x, y + row - self.scroll_top, text_width, 1, clear=True)
+            self.console.print_rect_ex(x, y + row - self.scroll_top, text_width, 1,
+                                       tcod.background.NONE, tcod.align.LEFT, label(self.source[row]))
+            if row == self.selected:
+                self.console.set_default_background(self.bgcolor)
+
+        if count > self.rect.height > 0:
+            thumb = y + self.scroll_top * self.rect.height / count
+            self.console.set_char_background(x + text_width, thumb, self.scrollbar_bgcolor)
+
+        super(VirtualList, self).render()
+
+    def handle_event(self, ev):
+        if ev.type is events.KEY:
+            vk = ev.data.vk
+            if vk == tcod.key.DOWN:
+                self.select(self.selected + 1)
+            elif vk == tcod.key.UP:
+                self.select(self.selected - 1)
+            elif vk == tcod.key.PAGEDOWN:
+                self.select(self.selected + self.page_size)
+            elif vk == tcod.key.PAGEUP:
+                self.select(self.selected - self.page_size)
+            elif vk == tcod.key.HOME:
+                self.select(0)
+            elif vk == tcod.key.END:
+                self.select(len(self.source) - 1)
+            elif vk == tcod.key.ENTER and self.handlers['activate'] and len(self.source):
+                self.handlers['activate'](self, self.selected)
+            else:
+                return super(VirtualList, self).handle_event(ev)
+            return True
+
+        return super(VirtualList, self).handle_event(ev)
+
+    def handle_mouse(self, ev):
+        if ev.data.wheel_up or ev.data.wheel_down:
+            self.scroll_by(-3 if ev.data.wheel_up else 3)
+            return True
+        elif ev.data.lbutton_pressed:
+            self.select(self.scroll_top + ev.data.cy - self.screen_origin.y)
+            return True
+        return False
+
+class MessageLog(Widget):
+    """
+    A scrolling log of (color-coded) messages, newest at the bottom. Only the
+    last `capacity` wrapped lines are kept, in a ring buffer mirrored by an
+    offscreen console of as many rows: a message is wrapped once, when it is
+    added, and each line is drawn into the offscreen console once, on the next
+    render; after that, showing any part of the history is at most two blits.
+
+    Colors set with the color set's control codes carry over to the lines a
+    message wraps onto. The width is fixed at creation.
+    """
+    def __init__(self, parent=None, console=None, x=0, y=0, width=0, height=0,
+                 capacity=500, color_set=None):
+        super(MessageLog, self).__init__(parent, console, x, y, width, height, color_set=color_set)
+        self.capacity = capacity
+        self.lines = collections.deque(maxlen=capacity)
+        self.line_count = 0 # lines ever added; line n is drawn in row n % capacity
+        self.drawn_count = 0
+        self.scroll = 0 # how many lines back from the newest the view ends
+        self.buffer = tcod.Console(max(1, self.rect.width), capacity)
+
+    def close(self):
+        self.buffer.close()
+        super(MessageLog, self).close()
+
+    def add_message(self, text):
+        color_set = self.color_set or tcod.color_set_empty
+        stop = chr(color_set.chars['0'])
+
+        active = ''
+        added = 0
+        for line in tcod.wrap_text(text, self.rect.width, color_set.control_chars):
+            line = active + line
+            for char in reversed(line):
+                if char in color_set.control_chars:
+                    active = '' if char == stop else char
+                    break
+            self.lines.append(line)
+            added += 1
+
+        self.line_count += added
+        if self.scroll:
+            self.scroll_by(added) # keep showing the same lines
+
+    def scroll_by(self, amount):
+        """ Scrolls back (positive amount) or forward through the history. """
+        self.scroll = max(0, min(self.scroll + amount, len(self.lines) - self.rect.height))
+
+    def render(self):
+        if self.color_set:
+            self.color_set.set_colors(0, self.fgcolor, self.bgcolor)
+            self.color_set.apply()
+
+        # Draw the lines added since the last render into the offscreen console
+        pending = min(self.line_count - self.drawn_count, self.capacity)
+        if pending:
+            new_lines = list(itertools.islice(reversed(self.lines), pending))
+            new_lines.reverse()
+
+            self.buffer.set_default_foreground(self.fgcolor)
+            self.buffer.set_default_background(self.bgcolor)
+            first = self.line_count - pending
+            for n, line in enumerate(new_lines, first):
+                row = n % self.capacity
+                self.buffer.rect(0, row, self.buffer.width, 1, clear=True)
+                self.buffer.print_ex(0, row, tcod.background.NONE, tcod.align.LEFT, line)
+            self.drawn_count = self.line_count
+
+        x, y = self.screen_origin
+        self.console.set_default_background(self.bgcolor)
+        self.console.rect(x, y, self.rect.width, self.rect.height, clear=True)
+
+        end = self.line_count - self.scroll
+        start = max(end - self.rect.height, self.line_count - len(self.lines))
+        count = end - start
+        if count > 0:
+            row = start % self.capacity
+            first_part = min(count, self.capacity - row)
+            self.buffer.blit(0, row, self.rect.width, first_part, self.console, x, y)
+            if count > first_part: # wrapped around the end of the ring
+                self.buffer.blit(0, 0, self.rect.width, count - first_part, self.console, x, y + first_part)
+
+        super(MessageLog, self).render()
+
+    def handle_event(self, ev):
+        if ev.type is events.KEY and ev.data.vk in (tcod.key.PAGEUP, tcod.key.PAGEDOWN):
+            page = max(1, self.rect.height - 1)
+            self.scroll_by(page if ev.data.vk == tcod.key.PAGEUP else -page)
+            return True
+
+        return super(MessageLog, self).handle_event(ev)
+
+    def handle_mouse(self, ev):
+        if ev.data.wheel_up or ev.data.wheel_down:
+            self.scroll_by(3 if ev.data.wheel_up else -3)
+            return True
+        return False
+
+class MapView(Widget):
+    """
+    A window onto a world.World: shows level z, with the camera (the view's
+    top-left corner) at world position (camera_x, camera_y). The arrow keys
+    pan it (by ten with Shift).
+
+    Tile ids are turned into characters and colors through a lookup table
+    built from the world's tile map, and drawn with the bulk console fills
+    into an offscreen console of the view's size. When the camera pans, the
+    previous frame's cells are shifted along and only the newly exposed rows
+    and columns are fetched from the world; call refresh() when the world
+    changes under the view. Overlays (tcod.Layers: dimming, lighting, ...)
+    are composited over the map in the same fill.
+
+    Tiles can come from another source with the world's get_tiles(), such as
+    a simulation.Simulation's snapshots: the view then tells the source what
+    it is looking at (plus WATCH_MARGIN around it) through watch(), and
+    redraws whenever the source's version changes. When only its
+    area_version changes (the source now covers another area), just the
+    cells that its previous area did not cover are fetched again.
+    """
+    PAN_KEYS = {tcod.key.LEFT: (-1, 0), tcod.key.RIGHT: (1, 0),
+                tcod.key.UP: (0, -1), tcod.key.DOWN: (0, 1)}
+    WATCH_MARGIN = 16
+
+    def __init__(self, world, parent=None, console=None, x=0, y=0, width=0, height=0, source=None):
+        super(MapView, self).__init__(parent, console, x, y, width, height)
+        self.world = world
+        self.source = source or world
+        self.source_version = None
+        self.source_area_version = None
+        self.covered = None # the source's published_area when the cells were fetched
+        # A live source changes on its own, so keep the frames coming
+        self.animating = hasattr(self.source, 'watch')
+        self.camera_x = self.camera_y = self.z = 0
+        self.view = tcod.Console(max(1, width), max(1, height))
+        self.cells = None # [y][x] -> (char, fg r, g, b, bg r, g, b)
+        self.cells_camera = None # the camera position self.cells were drawn for
+        self.compositor = tcod.Compositor(self.view.width, self.view.height)
+        self.base = self.compositor.add_layer(tcod.Layer(0, 0))
+        self.composited = False
+        self.refresh_palette()
+
+    def close(self):
+        self.view.close()
+        super(MapView, self).close()
+
+    def refresh_palette(self):
+        """ Rebuilds the lookup table from tile ids to characters and colors. """
+        tiles = [self.world.tilemap[i] for i in xrange(len(self.world.tilemap.tilemap))]
+        self.palette = numpy.array([[ord(tile.glyph)] + list(tile.fgcolor) + list(tile.bgcolor)
+                                    for tile in tiles], dtype=numpy.intc)
+        self.refresh()
+
+    def refresh(self):
+        """ Fetches all the visible tiles again on the next render. """
+        self.cells = None
+
+    def add_overlay(self, layer):
+        """ Draws layer over the map, above the overlays added before it. """
+        return self.compositor.add_layer(layer)
+
+    def remove_overlay(self, layer):
+        self.compositor.remove_layer(layer)
+
+    def pan(self, dx, dy):
+        self.camera_x += dx
+        self.camera_y += dy
+
+    def look_at(self, x, y, z=None):
+        """ Centers the camera on world position (x, y), on level z if given. """
+        self.camera_x = x - self.rect.width / 2
+        self.camera_y = y - self.rect.height / 2
+        if z is not None:
+            self.z = z
+
+    def fetch(self, left, top, width, height):
+        """ The cells for the world area width*height at (left, top), indexed [y][x]. """
+        return self.palette[self.source.get_tiles(left, top, self.z, width, height).T]
+
+    def fetch_uncovered(self, camera, covered):
+        """
+        Fetches again the cells (drawn for camera) outside covered, the area
+        the source published when they were fetched: up to a band above and
+        below it, and one left and right of it. False if there were none.
+        """
+        left, top, z = camera
+        width, height = self.view.width, self.view.height
+        if covered is None or covered[2] != z:
+            self.refresh()
+            return True
+        x0, y0 = max(left, covered[0]) - left, max(top, covered[1]) - top
+        x1 = min(left + width, covered[0] + covered[3]) - left
+        y1 = min(top + height, covered[1] + covered[4]) - top
+        if x0 >= x1 or y0 >= y1:
+            self.refresh()
+            return True
+
+        cells = self.cells
+        if y0 > 0:
+            cells[:y0] = self.fetch(left, top, width, y0)
+        if y1 < height:
+            cells[y1:] = self.fetch(left, top + y1, width, height - y1)
+        if x0 > 0:
+            cells[y0:y1, :x0] = self.fetch(left, top + y0, x0, y1 - y0)
+        if x1 < width:
+            cells[y0:y1, x1:] = self.fetch(left + x1, top + y0, width - x1, y1 - y0)
+        return x0 > 0 or y0 > 0 or x1 < width or y1 < height
+
+    def update_cells(self):
+        """ Brings self.cells up to date with the camera; False if they already were. """
+        version = getattr(self.source, 'version', None)
+        area_version = getattr(self.source, 'area_version', None)
+        covered = getattr(self.source, 'published_area', None)
+        fetched = False
+        if version != self.source_version:
+            self.source_version = version
+            self.refresh()
+        elif area_version != self.source_area_version and self.cells is not None:
+            fetched = self.fetch_uncovered(self.cells_camera, self.covered)
+        self.source_area_version = area_version
+        self.covered = covered
+
+        camera = (self.camera_x, self.camera_y, self.z)
+        if self.cells is not None and camera == self.cells_camera:
+            return fetched
+
+        width, height = self.view.width, self.view.height
+        if hasattr(self.source, 'watch'):
+            margin = self.WATCH_MARGIN
+            self.source.watch(self.camera_x - margin, self.camera_y - margin, self.z,
+                              width + 2 * margin, height + 2 * margin)
+        if self.cells is not None and camera[2] == self.cells_camera[2]:
+            dx = self.camera_x - self.cells_camera[0]
+            dy = self.camera_y - self.cells_camera[1]
+        else:
+            dx = dy = None
+
+        if dx is None or abs(dx) >= width or abs(dy) >= height:
+            self.cells = self.fetch(self.camera_x, self.camera_y, width, height)
+        else:
+            # new[y][x] is old[y+dy][x+dx] where both are in view...
+            cells = numpy.empty_like(self.cells)
+            cells[max(0, -dy):height-max(0, dy), max(0, -dx):width-max(0, dx)] = \
+                self.cells[max(0, dy):height-max(0, -dy), max(0, dx):width-max(0, -dx)]
+
+            # ...and the rest comes from the world: whole exposed columns first,
+            if dx > 0:
+                cells[:, width-dx:] = self.fetch(self.camera_x + width - dx, self.camera_y, dx, height)
+            elif dx < 0:
+                cells[:, :-dx] = self.fetch(self.camera_x, self.camera_y, -dx, height)
+
+            # then what is left of the exposed rows.
+            left, right = max(0, -dx), width - max(0, dx)
+            if dy > 0:
+                cells[height-dy:, left:right] = self.fetch(self.camera_x + left, self.camera_y + height - dy,
+                                                           right - left, dy)
+            elif dy < 0:
+                cells[:-dy, left:right] = self.fetch(self.camera_x + left, self.camera_y, right - left, -dy)
+            self.cells = cells
+
+        self.cells_camera = camera
+        return True
+
+    def render(self):
+        if (self.view.width, self.view.height) != (self.rect.width, self.rect.height):
+            self.view.resize(max(1, self.rect.width), max(1, self.rect.height))
+            self.refresh()
+
+        changed = self.update_cells()
+        if len(self.compositor.layers) > 1:
+            # Overlays can change at any time, so they are composited every frame
+            self.compositor.width, self.compositor.height = self.view.width, self.view.height
+            self.base.ch = self.cells[..., 0]
+            self.base.fg = self.cells[..., 1:4].astype(numpy.uint8)
+            self.base.bg = self.cells[..., 4:7].astype(numpy.uint8)
+            self.compositor.draw(self.view)
+            self.composited = True
+        elif changed or self.composited:
+            cells = self.cells.reshape(-1, 7)
+            self.view.fill(cells[:, 0], (cells[:, 1], cells[:, 2], cells[:, 3]),
+                           (cells[:, 4], cells[:, 5], cells[:, 6]))
+            self.composited = False
+
+        origin = self.screen_origin
+        self.view.blit(0, 0, self.rect.width, self.rect.height, self.console, origin.x, origin.y)
+        super(MapView, self).render()
+
+    def handle_event(self, ev):
+        if ev.type is events.KEY and ev.data.vk in self.PAN_KEYS:
+            dx, dy = self.PAN_KEYS[ev.data.vk]
+            step = 10 if ev.data.shift else 1
+            self.pan(dx * step, dy * step)
+            return True
+
+        return super(MapView, self).handle_event(ev)
+
 class Dialog(Widget):
     def __init__(self, parent=None, console=None, x=0, y=0, width=0, height=0):
         super(Dialog, self).__init__(parent, console, x, y, width, height)
@@ -412,8 +990,13 @@ class Menu(Dialog):
         item = self.list.add_item(label_text, disabled, on_activate)
         self.calc_size()
         self.keys[key] = item
+        self.subscribe(events.KEY, lambda ev: self.select(item), key=key)
         return item
 
+    def select(self, item):
+        self.list.selected_item = item
+        return True
+
     @property
     def selected_item(self):
         return self.list.selected_item
@@ -428,10 +1011,3 @@ class Menu(Dialog):
     def render(self):
         self.color_set.apply()
         super(Menu, self).render()
-
-    def handle_event(self, ev):
-        if ev.type == events.KEY and chr(ev.data.c) in self.keys:
-            self.list.selected_item = self.keys[chr(ev.data.c)]
-            return True
-
-        return super(Menu, self).handle_event(ev)
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 import json
 from collections import namedtuple
 from numpy import zeros, int16
+from numpy.random import RandomState
 
 from tcod import color
 
@@ -10,8 +11,48 @@ CHUNK_WIDTH = CHUNK_HEIGHT = 256
 CHUNK_DEPTH = 16
 
 class World(object):
-    def __init__(self):
-        self.chunk_provider = ChunkProvider()
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.tilemap = TileMap()
+        self.chunk_provider = ChunkProvider(self.generate_chunk)
+        self.ticks = 0
+        self.systems = []
+
+    def tick(self):
+        """ Advances the world by one step: each of self.systems gets a go at it. """
+        self.ticks += 1
+        for system in self.systems:
+            system(self)
+
+    def generate_chunk(self, chunk):
+        """ Placeholder terrain: a floor at z=0, scattered with walls. """
+        if not chunk.bottom <= 0 < chunk.top:
+            return
+
+        random = RandomState(hash((self.seed, chunk.west, chunk.north)) & 0xffffffff)
+        layer = chunk.tiles[0 - chunk.bottom]
+        layer[:] = self.tilemap.index('basic_floor')
+        layer[random.random_sample(layer.shape) < 0.08] = self.tilemap.index('basic_wall')
+
+    def get_tiles(self, west, north, z, width, height):
+        """
+        The tile ids of the width*height area at (west, north) on level z, as
+        an array indexed [x][y] like Chunk.tiles, gathered from as many chunks
+        as it spans.
+        """
+        result = zeros((width, height), dtype=int16)
+        x = west
+        while x < west + width:
+            x_end = min(coords_to_chunk(x, 0, 0)[0] + CHUNK_WIDTH, west + width)
+            y = north
+            while y < north + height:
+                y_end = min(coords_to_chunk(0, y, 0)[1] + CHUNK_HEIGHT, north + height)
+                chunk = self.chunk_provider[(x, y, z)]
+                result[x-west:x_end-west, y-north:y_end-north] = \
+                    chunk.tiles[z-chunk.bottom, x-chunk.west:x_end-chunk.west, y-chunk.north:y_end-chunk.north]
+                y = y_end
+            x = x_end
+        return result
 
 class Chunk(object):
     def __init__(self, west, north, bottom):
@@ -33,12 +74,23 @@ class Chunk(object):
         return 'Chunk(west=%d, north=%d, bottom=%d)' % (self.west, self.north, self.bottom)
 
 class ChunkProvider(dict):
+    """
+    Chunks by the coordinates of any point in them; missing chunks are created
+    (and passed to generator, if there is one) on first access.
+    """
+    def __init__(self, generator=None):
+        super(ChunkProvider, self).__init__()
+        self.generator = generator
+
     def __getitem__(self, key):
         new_key = coords_to_chunk(*key[0:3])
         return super(ChunkProvider, self).__getitem__(new_key)
 
     def __missing__(self, key):
-        return Chunk(*key[0:3])
+        chunk = self[key] = Chunk(*key[0:3])
+        if self.generator:
+            self.generator(chunk)
+        return chunk
 
 def coords_to_chunk(x, y, z):
     return (x - (x % CHUNK_WIDTH),
@@ -81,6 +133,10 @@ class TileMap(object):
         """ Will return a degraded Tile if the original is not available """
         return self._get_degraded(self.tilemap[key])
 
+    def index(self, tilename):
+        """ The id under which tilename is stored in the world. """
+        return self.tilemap.index(tilename)
+
     def _get_degraded(self, tilename):
         if tilename in tiles:
             return tiles[tilename]
@@ -1,14 +1,37 @@
 #!/usr/bin/env python
+import argparse, logging
+
 import tcod
 import game
+from game import replay
 
 width = game.config.parser.getint("core", "width")
 height = game.config.parser.getint("core", "height")
 fullscreen = game.config.parser.getboolean("core", "fullscreen")
+fps = game.config.parser.getint("core", "fps")
+game.dialogs.input_stage.key_repeat_rate = game.config.parser.getint("input", "key_repeat_rate")
+game.events.stats.log_interval = game.config.parser.getfloat("debug", "event_stats_interval")
+if game.events.stats.log_interval:
+    logging.basicConfig(level=logging.INFO)
 
 tcod.set_custom_font('fonts/consolas12x12_gs_tc.png', tcod.font.TYPE_GREYSCALE | tcod.font.LAYOUT_TCOD)
 tcod.init_root(width, height, title='NP-Complete', fullscreen=fullscreen)
-tcod.set_fps_limit(25)
+tcod.set_fps_limit(fps)
+game.dialogs.frame_budget = 1.0 / fps
 
 if __name__ == '__main__':
-    game.main_menu()
+    parser = argparse.ArgumentParser(description="NP-Complete")
+    parser.add_argument('--record', metavar='FILE', help="record the input to FILE")
+    parser.add_argument('--replay', metavar='FILE', help="play the input recorded in FILE")
+    parser.add_argument('--realtime', action='store_true', help="replay at the recorded pace")
+    args = parser.parse_args()
+
+    if args.replay:
+        game.dialogs.input_source = replay.Player(args.replay, realtime=args.realtime)
+    elif args.record:
+        game.dialogs.input_stage.recorder = replay.Recorder(args.record)
+    try:
+        game.main_menu()
+    finally:
+        if args.record and not args.replay:
+            game.dialogs.input_stage.recorder.close(game.dialogs.input_stage.frames)
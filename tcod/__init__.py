@@ -1,4 +1,18 @@
-import libtcodpy as libtcod
+import collections, os
+
+import numpy
+
+# The backend is picked once, when tcod is first imported: set TCOD_BACKEND to
+# "headless" to draw into in-memory numpy consoles instead of a libtcod window.
+backend = os.environ.get('TCOD_BACKEND', 'libtcod')
+if backend == 'headless':
+    import headless as libtcod
+else:
+    import libtcodpy as libtcod
+from text import wrap_text
+import compositor
+# Part of the wrapper's API, like the functions and classes defined below
+Compositor, Layer = compositor.Compositor, compositor.Layer
 
 class Random(object):
     def __init__(self, stream_id):
@@ -37,11 +51,14 @@ class Random(object):
 random = Random(0)
 
 def set_custom_font(fontfile, flags=libtcod.FONT_LAYOUT_ASCII_INROW, horizontal_count=0, vertical_count=0):
+    image_cache.evict()
     return libtcod.console_set_custom_font(fontfile, flags, horizontal_count, vertical_count)
 
 def init_root(width, height, title, fullscreen=False, renderer=libtcod.RENDERER_SDL):
     root_console.height = height
     root_console.width = width
+    color_control.invalidate()
+    image_cache.evict()
     return libtcod.console_init_root(width, height, title, fullscreen, renderer)
 
 def wait_for_keypress(flush=False):
@@ -57,6 +74,19 @@ def check_for_event(mask=libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE):
     libtcod.sys_check_for_event(mask, key, mouse)
     return (key, mouse)
 
+def next_event(mask=libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE, wait=False, flush=False):
+    """
+    Like check_for_event() (or wait_for_event(), if wait), but also tells you
+    which event it was: returns (event, key, mouse), where event is one of the
+    tcod.event flags, or 0 if nothing happened.
+    """
+    key, mouse = (libtcod.Key(), libtcod.Mouse())
+    if wait:
+        event = libtcod.sys_wait_for_event(mask, key, mouse, flush)
+    else:
+        event = libtcod.sys_check_for_event(mask, key, mouse)
+    return (event, key, mouse)
+
 def set_fullscreen(want_fullscreen=True):
     return libtcod.console_set_fullscreen(want_fullscreen)
 
@@ -81,26 +111,115 @@ def get_fps():
 def get_elapsed_milli():
     return libtcod.sys_elapsed_milli()
 
+def sleep_milli(milliseconds):
+    return libtcod.sys_sleep_milli(milliseconds)
+
 def get_last_frame_length():
     return libtcod.sys_get_last_frame_length()
 
+class ConsolePool(object):
+    """
+    Keeps the native consoles of closed Consoles for reuse, instead of
+    console_delete()ing them. They are bucketed by size, rounded up to powers
+    of two, so a Console is usually a view onto the top-left corner of a
+    somewhat larger native console; when its own bucket is empty, a free
+    console up to four times larger will do.
+
+    Released consoles get their default colors back and are cleared, so the
+    next user finds them as new. One that was given a key color cannot be
+    (libtcod has no call to unset it), so it is deleted instead.
+    """
+    MIN_SIZE = 8
+
+    def __init__(self):
+        self.free = collections.defaultdict(list)
+        self.allocated = 0
+        self.in_use = 0
+        self.high_water = 0
+        self.reused = 0
+
+    @classmethod
+    def bucket(cls, width, height):
+        """ The native size used for a width*height console. """
+        size = [cls.MIN_SIZE, cls.MIN_SIZE]
+        for i, wanted in enumerate((width, height)):
+            while size[i] < wanted:
+                size[i] *= 2
+        return tuple(size)
+
+    def acquire(self, width, height):
+        """ A (console_id, native size) pair for a console of at least width*height. """
+        size = self.bucket(width, height)
+        if not self.free[size]:
+            larger = [other for other, consoles in self.free.iteritems()
+                      if consoles and other[0] >= size[0] and other[1] >= size[1]
+                      and other[0] * other[1] <= 4 * size[0] * size[1]]
+            if larger:
+                size = min(larger, key=lambda other: other[0] * other[1])
+
+        if self.free[size]:
+            console_id = self.free[size].pop()
+            self.reused += 1
+        else:
+            console_id = libtcod.console_new(*size)
+            self.allocated += 1
+
+        self.in_use += 1
+        self.high_water = max(self.high_water, self.in_use)
+        return console_id, size
+
+    def release(self, console_id, size, reusable=True):
+        """ Takes back a console; reusable is False if it was given a key color. """
+        self.in_use -= 1
+        if not reusable:
+            libtcod.console_delete(console_id)
+            self.allocated -= 1
+            return
+        libtcod.console_set_default_foreground(console_id, libtcod.white)
+        libtcod.console_set_default_background(console_id, libtcod.black)
+        libtcod.console_clear(console_id)
+        self.free[size].append(console_id)
+
+    def clear(self):
+        """ console_delete()s all the free consoles. """
+        for consoles in self.free.itervalues():
+            for console_id in consoles:
+                libtcod.console_delete(console_id)
+            self.allocated -= len(consoles)
+        self.free.clear()
+
+    def get_stats(self):
+        return {'allocated': self.allocated, 'in_use': self.in_use,
+                'high_water': self.high_water, 'reused': self.reused}
+
+console_pool = ConsolePool()
+
 class Console(object):
+    """
+    An offscreen console (or the root console, given ROOT_ID). Offscreen
+    consoles come from console_pool, so their native console may be larger
+    than width*height (its size is self.capacity); close() them when done to
+    hand it back, or leave it to the garbage collector.
+    """
     # Root console has id 0
     ROOT_ID = 0
 
     def __init__(self, width=20, height=10, console_id=None):
+        self.key_color = None
         if console_id is None:
-            self.console_id = libtcod.console_new(width, height)
+            self.console_id, self.capacity = console_pool.acquire(width, height)
             self.width = width
             self.height = height
         else:
             self.console_id = console_id
+            self.capacity = None
             self.width = libtcod.console_get_width(console_id)
             self.height = libtcod.console_get_height(console_id)
 
     def close(self):
-        if self.console_id != self.ROOT_ID: # Root console cannot be console_delete()d
-            libtcod.console_delete(self.console_id)
+        if self.capacity is not None: # The root console is not ours to give back
+            console_pool.release(self.console_id, self.capacity, reusable=self.key_color is None)
+            self.capacity = None
 
     def __del__(self):
         self.close()
@@ -118,7 +237,12 @@ class Console(object):
         self.resize(width, height)
 
     def resize(self, width=None, height=None):
-        """ Resize a console by destroying and recreating it """
+        """
+        Resize a console; its contents are kept only if it still fits in its
+        native console (what a larger size brings into view is cleared to the
+        default background), otherwise it is swapped for a cleared pooled one
+        of the right size.
+        """
         if self.console_id == self.ROOT_ID:
             raise AttributeError("The root console cannot be resized!")
         if width is None:
@@ -129,8 +253,18 @@ class Console(object):
         if self.height == height and self.width == width:
             return # No resize needed.
 
-        libtcod.console_delete(self.console_id)
-        self.console_id = libtcod.console_new(width, height)
+        if self.capacity != ConsolePool.bucket(width, height):
+            self.close()
+            self.console_id, self.capacity = console_pool.acquire(width, height)
+            if self.key_color is not None:
+                libtcod.console_set_key_color(self.console_id, self.key_color)
+        else: # The native console may hold anything outside the old size
+            if width > self.width:
+                libtcod.console_rect(self.console_id, self.width, 0, width - self.width, height,
+                                     True, libtcod.BKGND_SET)
+            if height > self.height:
+                libtcod.console_rect(self.console_id, 0, self.height, width, height - self.height,
+                                     True, libtcod.BKGND_SET)
         self.width = width
         self.height = height
 
@@ -143,6 +277,8 @@ class Console(object):
         self.__init__(state['width'], state['height'])
 
     def set_key_color(self, color):
+        """ Note that this keeps the console's native console out of the pool once it is closed. """
+        self.key_color = color
         return libtcod.console_set_key_color(self.console_id, color)
 
     def blit(self, src_x=0, src_y=0, src_width=None, src_height=None,
@@ -183,6 +319,32 @@ class Console(object):
             raise ValueError("Trying to console.print_ex a None!")
         return libtcod.console_print_ex(self.console_id, x, y, flags, align, text)
 
+    def fill(self, chars=None, fgcolors=None, bgcolors=None):
+        """
+        Sets the characters and/or colors of the whole console at once. chars
+        is a sequence (ideally a numpy array) of width*height character codes
+        in row order; fgcolors and bgcolors are (reds, greens, blues) triples
+        of such sequences.
+        """
+        if chars is not None:
+            libtcod.console_fill_char(self.console_id, self._pad(chars))
+        if fgcolors is not None:
+            libtcod.console_fill_foreground(self.console_id, *[self._pad(c) for c in fgcolors])
+        if bgcolors is not None:
+            libtcod.console_fill_background(self.console_id, *[self._pad(c) for c in bgcolors])
+
+    def _pad(self, values):
+        """
+        values (width*height of them), laid out for the whole native console,
+        as C ints: libtcod reads the fill buffers as int*, whatever numpy's
+        default integer size.
+        """
+        if self.capacity is None or self.capacity == (self.width, self.height):
+            return numpy.ascontiguousarray(values, dtype=numpy.intc)
+        padded = numpy.zeros((self.capacity[1], self.capacity[0]), dtype=numpy.intc)
+        padded[:self.height, :self.width] = numpy.asarray(values).reshape(self.height, self.width)
+        return padded.ravel()
+
     def rect(self, x, y, width, height, clear=False, effect=libtcod.BKGND_SET):
         return libtcod.console_rect(self.console_id, x, y, width, height, clear, effect)
 
@@ -198,13 +360,14 @@ class Console(object):
         return libtcod.console_clear(self.console_id)
 
     def get_height_rect(self, x=0, y=0, width=None, height=None, text=''):
+        """ Like libtcod's, but served from the layout_text() cache. """
         if text is None:
             raise ValueError("Trying to console.get_height_rect of a None!")
         if width is None:
             width = self.width - x
         if height is None:
             height = self.height - y
-        return libtcod.console_get_height_rect(self.console_id, x, y, width, height, text)
+        return min(layout_text(text, width).height, height)
 
     def print_rect_ex(self, x=0, y=0, width=None, height=None, effect=libtcod.BKGND_NONE,
                       align=libtcod.LEFT, text=''):
@@ -263,6 +426,108 @@ class ImageFile(Image):
         self.image_id = libtcod.image_load(path)
         self.width, self.height = self.get_size()
 
+class ImageCache(object):
+    """
+    Shares image files between everyone who uses them: each path is only
+    loaded once. It also keeps, per path and size, an offscreen console with
+    the image already blit_2x()ed into it, so drawing the image again is a
+    single console blit. Only the max_renders most recently used renderings
+    are kept; the others' consoles go back to the pool, so blit a rendering
+    right away rather than holding on to it.
+
+    The renderings depend on the font and console sizes; evict() them when
+    those change (set_custom_font() and init_root() do so for you).
+    """
+    def __init__(self, max_renders=8):
+        self.images = {}
+        self.renders = collections.OrderedDict()
+        self.max_renders = max_renders
+
+    def load(self, path):
+        """ The ImageFile for path, loaded on first use. """
+        try:
+            return self.images[path]
+        except KeyError:
+            image = self.images[path] = ImageFile(path)
+            return image
+
+    def render(self, path, width=0, height=0):
+        """
+        A Console holding the image at path, blit_2x()ed. The console is at
+        most width*height (0 for as large as the image), and never larger than
+        the image -- at two pixels per cell, that is half its size.
+        """
+        key = (path, width, height)
+        try:
+            console = self.renders.pop(key)
+        except KeyError:
+            pass
+        else:
+            self.renders[key] = console # now the most recently used
+            return console
+
+        image = self.load(path)
+        image_width, image_height = (image.width + 1) / 2, (image.height + 1) / 2
+        console = Console(min(width or image_width, image_width),
+                          min(height or image_height, image_height))
+        image.blit_2x(console, width=min(console.width * 2, image.width),
+                      height=min(console.height * 2, image.height))
+        self.renders[key] = console
+        while len(self.renders) > self.max_renders:
+            self.renders.popitem(last=False)[1].close()
+        return console
+
+    def evict(self):
+        """ Forget all renderings; loaded images are kept. """
+        for console in self.renders.itervalues():
+            console.close()
+        self.renders.clear()
+
+    def clear(self):
+        """ Forget everything. """
+        self.evict()
+        self.images.clear()
+
+# The shared image cache
+image_cache = ImageCache()
+
+class ColorControlCache(object):
+    """
+    libtcod keeps a single, global table of the five color control pairs. This
+    remembers what we last sent it, so that console_set_color_control() is only
+    called for pairs that actually change.
+
+    The issued and skipped counters tell you how often the cache pays off; use
+    invalidate() if something else may have touched the table behind our back.
+    """
+    def __init__(self):
+        self.pairs = {}
+        self.issued = 0
+        self.skipped = 0
+
+    def set(self, color_code, fgcolor, bgcolor):
+        pair = (fgcolor.r, fgcolor.g, fgcolor.b, bgcolor.r, bgcolor.g, bgcolor.b)
+        if self.pairs.get(color_code) == pair:
+            self.skipped += 1
+            return
+
+        libtcod.console_set_color_control(color_code, fgcolor, bgcolor)
+        self.pairs[color_code] = pair
+        self.issued += 1
+
+    def invalidate(self):
+        """ Forget the known state; the next set() of every pair will be issued. """
+        self.pairs.clear()
+
+    def get_stats(self):
+        return {'issued': self.issued, 'skipped': self.skipped}
+
+    def reset_stats(self):
+        self.issued = self.skipped = 0
+
+# The (global) color control state
+color_control = ColorControlCache()
+
 class ColorSet(object):
     """
     Defines five color pairs to be used to change colors in mid-string -- see
@@ -293,6 +558,8 @@ class ColorSet(object):
                        libtcod.COLCTRL_3: (None, None),
                        libtcod.COLCTRL_4: (None, None),
                        libtcod.COLCTRL_5: (None, None)}
+        # The deletion table for strip() -- self.chars never changes.
+        self.control_chars = ''.join([chr(x) for x in self.chars.values()])
 
     def set_colors(self, pair_id, fgcolor=None, bgcolor=None):
         """
@@ -321,13 +588,14 @@ class ColorSet(object):
 
     def strip(self, string):
         """ Gives you string with the color control characters removed. """
-        return string.translate(None, ''.join([chr(x) for x in self.chars.values()]))
+        return string.translate(None, self.control_chars)
 
     def apply(self, console=None):
         """
         Call this before rendering a string that wants to use the color pairs
         defined in this ColorSet. If you provide a console, the console's fore-
-        and background will be set to the default colors.
+        and background will be set to the default colors. Pairs that libtcod
+        already has are not sent again (see tcod.color_control).
         """
         if console:
             console.set_default_foreground(self.fgcolor)
@@ -339,10 +607,44 @@ class ColorSet(object):
                 fgcolor = self.fgcolor
             if bgcolor is None:
                 bgcolor = self.bgcolor
-            libtcod.console_set_color_control(color_code, fgcolor, bgcolor)
+            color_control.set(color_code, fgcolor, bgcolor)
 
 color_set_empty = ColorSet()
 
+class TextLayout(object):
+    """
+    The result of wrapping a string into a given width: the lines it breaks
+    into (color control characters are kept, but take up no room) and the
+    height and width they occupy. Use layout_text() to get one.
+    """
+    def __init__(self, text, width, control_chars):
+        self.lines = wrap_text(text, width, control_chars)
+        self.height = len(self.lines)
+        self.width = max([len(line.translate(None, control_chars)) for line in self.lines])
+
+_layout_cache = {}
+LAYOUT_CACHE_SIZE = 1024
+
+def layout_text(text, width, color_set=None):
+    """
+    Gives you the (memoized) TextLayout of text wrapped into width. Labels
+    whose text changes often (e.g. while being typed out) fill the cache
+    quickly, so it is simply emptied whenever it outgrows LAYOUT_CACHE_SIZE.
+    """
+    if color_set is None:
+        color_set = color_set_empty
+    key = (text, width, color_set.control_chars)
+
+    try:
+        return _layout_cache[key]
+    except KeyError:
+        pass
+
+    if len(_layout_cache) >= LAYOUT_CACHE_SIZE:
+        _layout_cache.clear()
+    layout = _layout_cache[key] = TextLayout(text, width, color_set.control_chars)
+    return layout
+
 # Useful constants
 class background(object):
     NONE = libtcod.BKGND_NONE
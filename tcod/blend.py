@@ -0,0 +1,112 @@
+"""
+libtcod's rules for mixing colors and cells, in numpy; shared by the headless
+backend and the compositor.
+"""
+import numpy
+
+# background rendering modes (the same values as libtcod's)
+BKGND_NONE = 0
+BKGND_SET = 1
+BKGND_MULTIPLY = 2
+BKGND_LIGHTEN = 3
+BKGND_DARKEN = 4
+BKGND_SCREEN = 5
+BKGND_COLOR_DODGE = 6
+BKGND_COLOR_BURN = 7
+BKGND_ADD = 8
+BKGND_ADDA = 9
+BKGND_BURN = 10
+BKGND_OVERLAY = 11
+BKGND_ALPH = 12
+BKGND_DEFAULT=13
+
+def BKGND_ALPHA(a):
+    return BKGND_ALPH | (int(a * 255) << 8)
+
+def BKGND_ADDALPHA(a):
+    return BKGND_ADDA | (int(a * 255) << 8)
+
+def blend(back, col, flag):
+    """
+    Applies a BKGND_* flag (possibly with its alpha in the upper bits) to an
+    array of background colors back, using the color(s) col. Returns a new
+    uint8 array.
+    """
+    mode = flag & 0xff
+    alpha = (flag >> 8) / 255.0
+    if mode == BKGND_NONE or mode == BKGND_DEFAULT:
+        return back
+
+    b = back.astype(numpy.int32)
+    c = numpy.asarray(col, dtype=numpy.int32)
+    if mode == BKGND_SET:
+        out = b * 0 + c
+    elif mode == BKGND_MULTIPLY:
+        out = b * c / 255
+    elif mode == BKGND_LIGHTEN:
+        out = numpy.maximum(b, c)
+    elif mode == BKGND_DARKEN:
+        out = numpy.minimum(b, c)
+    elif mode == BKGND_SCREEN:
+        out = 255 - (255 - b) * (255 - c) / 255
+    elif mode == BKGND_COLOR_DODGE:
+        out = numpy.where(b != 255, c * 255 / numpy.maximum(1, 255 - b), 255)
+    elif mode == BKGND_COLOR_BURN:
+        out = numpy.where(c > 0, 255 - (255 - b) * 255 / numpy.maximum(1, c), 0)
+    elif mode == BKGND_ADD:
+        out = b + c
+    elif mode == BKGND_ADDA:
+        out = b + alpha * c
+    elif mode == BKGND_BURN:
+        out = b + c - 255
+    elif mode == BKGND_OVERLAY:
+        out = numpy.where(c <= 128, 2 * c * b / 255, 255 - 2 * (255 - c) * (255 - b) / 255)
+    elif mode == BKGND_ALPH:
+        out = b + alpha * (c - b)
+    else:
+        raise ValueError("Unknown background flag %d" % flag)
+
+    return numpy.clip(out, 0, 255).astype(numpy.uint8)
+
+def lerp(a, b, alpha):
+    """ a to b by alpha: a number, or an array with one value per cell. """
+    alpha = numpy.asarray(alpha, dtype=numpy.float32)
+    if alpha.ndim:
+        alpha = alpha[..., numpy.newaxis]
+    return (a + alpha * (b.astype(numpy.float32) - a)).astype(numpy.uint8)
+
+def fade(dch, dfg, dbg, sch, sfg, sbg, ffade, bfade):
+    """
+    What console_blit() makes of destination cells when the source cells are
+    blitted over them with foreground and background fades ffade and bfade:
+    returns the new (characters, foregrounds, backgrounds).
+    """
+    if numpy.all(numpy.asarray(ffade) == 1.0) and numpy.all(numpy.asarray(bfade) == 1.0):
+        return sch, sfg, sbg
+
+    ffade = numpy.broadcast_to(numpy.asarray(ffade, dtype=numpy.float32), sch.shape)
+    new_bg = lerp(dbg, sbg, bfade)
+    new_ch = dch.copy()
+    new_fg = dfg.copy()
+
+    # A space lets the glyph below show through, tinted by its background...
+    space = sch == ord(' ')
+    new_fg[space] = lerp(dfg, sbg, bfade)[space]
+
+    # ...a glyph over a space or the same glyph fades in...
+    take = ~space & (dch == ord(' '))
+    new_ch[take] = sch[take]
+    new_fg[take] = lerp(dbg, sfg, ffade)[take]
+
+    same = ~space & (dch == sch)
+    new_fg[same] = lerp(dfg, sfg, ffade)[same]
+
+    # ...and over another glyph, the one below fades out before it fades in.
+    other = ~space & ~take & ~same
+    out = other & (ffade < 0.5)
+    new_fg[out] = lerp(dfg, dbg, ffade * 2)[out]
+    into = other & (ffade >= 0.5)
+    new_ch[into] = sch[into]
+    new_fg[into] = lerp(dbg, sfg, (ffade - 0.5) * 2)[into]
+
+    return new_ch, new_fg, new_bg
@@ -0,0 +1,119 @@
+"""
+Layered drawing in numpy. Instead of blitting console over console with
+fades (one native pass each), keep each layer as arrays and let a Compositor
+flatten them all in one go, then draw the result with a single bulk fill:
+
+    >>> comp = Compositor(80, 50)
+    >>> base = comp.add_layer(Layer(80, 50))
+    >>> shade = comp.add_layer(Layer(80, 50, opacity=0.5, glyphs=False))
+    >>> shade.bg[:] = (0, 0, 0)
+    >>> comp.draw(console)
+"""
+import numpy
+
+from blend import blend, fade, lerp, BKGND_SET
+
+class Layer(object):
+    """
+    A width*height grid of cells at (x, y) in its compositor: ch[y, x] is the
+    character code, fg[y, x] and bg[y, x] its (r, g, b) colors.
+
+    Layers are drawn like console_blit() draws a console: the background is
+    combined with what is below through `mode` (one of tcod.background's, the
+    same as libtcod's BKGND_* flags), then faded in by `opacity` -- a number,
+    or an array with one value per cell -- and glyphs fade in and out by the
+    same rules as blit fades. Cells whose background is `key_color` are left
+    out, as with Console.set_key_color().
+
+    A layer without glyphs is a filter: it only tints the colors below with
+    its background colors (e.g. mode MULTIPLY for lighting, or a black
+    background at partial opacity for dimming).
+    """
+    def __init__(self, width, height, x=0, y=0, opacity=1.0, mode=BKGND_SET,
+                 key_color=None, glyphs=True):
+        self.x = x
+        self.y = y
+        self.ch = numpy.zeros((height, width), dtype=numpy.intc)
+        self.ch[:] = ord(' ')
+        self.fg = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        self.fg[:] = 255
+        self.bg = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        self.opacity = opacity
+        self.mode = mode
+        self.key_color = key_color
+        self.glyphs = glyphs
+        self.visible = True
+
+    @property
+    def width(self):
+        return self.ch.shape[1]
+
+    @property
+    def height(self):
+        return self.ch.shape[0]
+
+class Compositor(object):
+    """ Flattens its layers, bottom (the first added) to top, into one grid. """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = []
+
+    def add_layer(self, layer):
+        self.layers.append(layer)
+        return layer
+
+    def remove_layer(self, layer):
+        self.layers.remove(layer)
+
+    def composite(self):
+        """ The flattened (characters, foregrounds, backgrounds), indexed [y, x]. """
+        ch = numpy.zeros((self.height, self.width), dtype=numpy.intc)
+        ch[:] = ord(' ')
+        fg = numpy.zeros((self.height, self.width, 3), dtype=numpy.uint8)
+        fg[:] = 255
+        bg = numpy.zeros((self.height, self.width, 3), dtype=numpy.uint8)
+
+        for layer in self.layers:
+            if not layer.visible:
+                continue
+
+            # The part of the layer that is inside the compositor
+            x0, y0 = max(0, layer.x), max(0, layer.y)
+            x1 = min(self.width, layer.x + layer.width)
+            y1 = min(self.height, layer.y + layer.height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            d = (slice(y0, y1), slice(x0, x1))
+            s = (slice(y0 - layer.y, y1 - layer.y), slice(x0 - layer.x, x1 - layer.x))
+
+            opacity = layer.opacity
+            if numpy.ndim(opacity):
+                opacity = numpy.asarray(opacity)[s]
+            lch, lfg, lbg = layer.ch[s], layer.fg[s], layer.bg[s]
+            dch, dfg, dbg = ch[d], fg[d], bg[d]
+
+            new_bg = lerp(dbg, blend(dbg, lbg, layer.mode), opacity)
+            if layer.glyphs:
+                new_ch, new_fg, _ = fade(dch, dfg, dbg, lch, lfg, lbg, opacity, opacity)
+            else:
+                new_ch, new_fg = dch, lerp(dfg, blend(dfg, lbg, layer.mode), opacity)
+
+            if layer.key_color is None:
+                ch[d], fg[d], bg[d] = new_ch, new_fg, new_bg
+            else:
+                mask = numpy.any(lbg != numpy.array(tuple(layer.key_color), dtype=numpy.uint8), axis=-1)
+                dch[mask], dfg[mask], dbg[mask] = new_ch[mask], new_fg[mask], new_bg[mask]
+
+        return ch, fg, bg
+
+    def draw(self, console):
+        """
+        Composites the layers into console (which should be their size) in one
+        fill, with every array already the C ints libtcod reads.
+        """
+        ch, fg, bg = self.composite()
+        # One contiguous row per channel
+        fg = numpy.ascontiguousarray(fg.reshape(-1, 3).T, dtype=numpy.intc)
+        bg = numpy.ascontiguousarray(bg.reshape(-1, 3).T, dtype=numpy.intc)
+        console.fill(ch.ravel(), (fg[0], fg[1], fg[2]), (bg[0], bg[1], bg[2]))
@@ -0,0 +1,1006 @@
+"""
+An in-memory stand-in for libtcodpy, for running without libtcod or a window.
+
+Consoles are numpy arrays (characters, foreground and background colors), so
+anything drawn can be inspected afterwards; input comes from a queue that you
+fill with push_key() and push_mouse(). Only the parts of libtcodpy that the
+tcod wrapper uses are provided, and some are approximations -- image_blit_2x()
+averages each 2x2 block of pixels into a background color instead of picking
+subcell characters, for instance.
+
+Select it by setting TCOD_BACKEND=headless in the environment before tcod is
+first imported. It never sleeps to honour sys_set_fps() unless you set
+headless.throttle = True, so the main loop runs as fast as it can.
+"""
+import collections, random, struct, time, zlib
+
+import numpy
+
+from blend import blend, fade
+from text import CONTROL_CHARS, wrap_text
+
+class Color(object):
+    __slots__ = ('r', 'g', 'b')
+
+    def __init__(self, r=0, g=0, b=0):
+        self.r = r
+        self.g = g
+        self.b = b
+
+    def __eq__(self, c):
+        return (self.r, self.g, self.b) == (c.r, c.g, c.b)
+
+    def __ne__(self, c):
+        return not self == c
+
+    def __mul__(self, c):
+        if isinstance(c, Color):
+            return Color(self.r * c.r / 255, self.g * c.g / 255, self.b * c.b / 255)
+        return Color(*[min(255, max(0, int(x * c))) for x in self])
+
+    def __add__(self, c):
+        return Color(min(255, self.r + c.r), min(255, self.g + c.g), min(255, self.b + c.b))
+
+    def __sub__(self, c):
+        return Color(max(0, self.r - c.r), max(0, self.g - c.g), max(0, self.b - c.b))
+
+    def __repr__(self):
+        return "Color(%d,%d,%d)" % (self.r, self.g, self.b)
+
+    def __getitem__(self, i):
+        if type(i) == str:
+            return getattr(self, i)
+        else:
+            return getattr(self, "rgb"[i])
+
+    def __setitem__(self, i, c):
+        if type(i) == str:
+            setattr(self, i, c)
+        else:
+            setattr(self, "rgb"[i], c)
+
+    def __iter__(self):
+        yield self.r
+        yield self.g
+        yield self.b
+
+# default colors (the same as libtcodpy's)
+# grey levels
+black=Color(0,0,0)
+darkest_grey=Color(31,31,31)
+darker_grey=Color(63,63,63)
+dark_grey=Color(95,95,95)
+grey=Color(127,127,127)
+light_grey=Color(159,159,159)
+lighter_grey=Color(191,191,191)
+lightest_grey=Color(223,223,223)
+darkest_gray=Color(31,31,31)
+darker_gray=Color(63,63,63)
+dark_gray=Color(95,95,95)
+gray=Color(127,127,127)
+light_gray=Color(159,159,159)
+lighter_gray=Color(191,191,191)
+lightest_gray=Color(223,223,223)
+white=Color(255,255,255)
+
+# sepia
+darkest_sepia=Color(31,24,15)
+darker_sepia=Color(63,50,31)
+dark_sepia=Color(94,75,47)
+sepia=Color(127,101,63)
+light_sepia=Color(158,134,100)
+lighter_sepia=Color(191,171,143)
+lightest_sepia=Color(222,211,195)
+
+#standard colors
+red=Color(255,0,0)
+flame=Color(255,63,0)
+orange=Color(255,127,0)
+amber=Color(255,191,0)
+yellow=Color(255,255,0)
+lime=Color(191,255,0)
+chartreuse=Color(127,255,0)
+green=Color(0,255,0)
+sea=Color(0,255,127)
+turquoise=Color(0,255,191)
+cyan=Color(0,255,255)
+sky=Color(0,191,255)
+azure=Color(0,127,255)
+blue=Color(0,0,255)
+han=Color(63,0,255)
+violet=Color(127,0,255)
+purple=Color(191,0,255)
+fuchsia=Color(255,0,255)
+magenta=Color(255,0,191)
+pink=Color(255,0,127)
+crimson=Color(255,0,63)
+
+# dark colors
+dark_red=Color(191,0,0)
+dark_flame=Color(191,47,0)
+dark_orange=Color(191,95,0)
+dark_amber=Color(191,143,0)
+dark_yellow=Color(191,191,0)
+dark_lime=Color(143,191,0)
+dark_chartreuse=Color(95,191,0)
+dark_green=Color(0,191,0)
+dark_sea=Color(0,191,95)
+dark_turquoise=Color(0,191,143)
+dark_cyan=Color(0,191,191)
+dark_sky=Color(0,143,191)
+dark_azure=Color(0,95,191)
+dark_blue=Color(0,0,191)
+dark_han=Color(47,0,191)
+dark_violet=Color(95,0,191)
+dark_purple=Color(143,0,191)
+dark_fuchsia=Color(191,0,191)
+dark_magenta=Color(191,0,143)
+dark_pink=Color(191,0,95)
+dark_crimson=Color(191,0,47)
+
+# darker colors
+darker_red=Color(127,0,0)
+darker_flame=Color(127,31,0)
+darker_orange=Color(127,63,0)
+darker_amber=Color(127,95,0)
+darker_yellow=Color(127,127,0)
+darker_lime=Color(95,127,0)
+darker_chartreuse=Color(63,127,0)
+darker_green=Color(0,127,0)
+darker_sea=Color(0,127,63)
+darker_turquoise=Color(0,127,95)
+darker_cyan=Color(0,127,127)
+darker_sky=Color(0,95,127)
+darker_azure=Color(0,63,127)
+darker_blue=Color(0,0,127)
+darker_han=Color(31,0,127)
+darker_violet=Color(63,0,127)
+darker_purple=Color(95,0,127)
+darker_fuchsia=Color(127,0,127)
+darker_magenta=Color(127,0,95)
+darker_pink=Color(127,0,63)
+darker_crimson=Color(127,0,31)
+
+# darkest colors
+darkest_red=Color(63,0,0)
+darkest_flame=Color(63,15,0)
+darkest_orange=Color(63,31,0)
+darkest_amber=Color(63,47,0)
+darkest_yellow=Color(63,63,0)
+darkest_lime=Color(47,63,0)
+darkest_chartreuse=Color(31,63,0)
+darkest_green=Color(0,63,0)
+darkest_sea=Color(0,63,31)
+darkest_turquoise=Color(0,63,47)
+darkest_cyan=Color(0,63,63)
+darkest_sky=Color(0,47,63)
+darkest_azure=Color(0,31,63)
+darkest_blue=Color(0,0,63)
+darkest_han=Color(15,0,63)
+darkest_violet=Color(31,0,63)
+darkest_purple=Color(47,0,63)
+darkest_fuchsia=Color(63,0,63)
+darkest_magenta=Color(63,0,47)
+darkest_pink=Color(63,0,31)
+darkest_crimson=Color(63,0,15)
+
+# light colors
+light_red=Color(255,114,114)
+light_flame=Color(255,149,114)
+light_orange=Color(255,184,114)
+light_amber=Color(255,219,114)
+light_yellow=Color(255,255,114)
+light_lime=Color(219,255,114)
+light_chartreuse=Color(184,255,114)
+light_green=Color(114,255,114)
+light_sea=Color(114,255,184)
+light_turquoise=Color(114,255,219)
+light_cyan=Color(114,255,255)
+light_sky=Color(114,219,255)
+light_azure=Color(114,184,255)
+light_blue=Color(114,114,255)
+light_han=Color(149,114,255)
+light_violet=Color(184,114,255)
+light_purple=Color(219,114,255)
+light_fuchsia=Color(255,114,255)
+light_magenta=Color(255,114,219)
+light_pink=Color(255,114,184)
+light_crimson=Color(255,114,149)
+
+#lighter colors
+lighter_red=Color(255,165,165)
+lighter_flame=Color(255,188,165)
+lighter_orange=Color(255,210,165)
+lighter_amber=Color(255,232,165)
+lighter_yellow=Color(255,255,165)
+lighter_lime=Color(232,255,165)
+lighter_chartreuse=Color(210,255,165)
+lighter_green=Color(165,255,165)
+lighter_sea=Color(165,255,210)
+lighter_turquoise=Color(165,255,232)
+lighter_cyan=Color(165,255,255)
+lighter_sky=Color(165,232,255)
+lighter_azure=Color(165,210,255)
+lighter_blue=Color(165,165,255)
+lighter_han=Color(188,165,255)
+lighter_violet=Color(210,165,255)
+lighter_purple=Color(232,165,255)
+lighter_fuchsia=Color(255,165,255)
+lighter_magenta=Color(255,165,232)
+lighter_pink=Color(255,165,210)
+lighter_crimson=Color(255,165,188)
+
+# lightest colors
+lightest_red=Color(255,191,191)
+lightest_flame=Color(255,207,191)
+lightest_orange=Color(255,223,191)
+lightest_amber=Color(255,239,191)
+lightest_yellow=Color(255,255,191)
+lightest_lime=Color(239,255,191)
+lightest_chartreuse=Color(223,255,191)
+lightest_green=Color(191,255,191)
+lightest_sea=Color(191,255,223)
+lightest_turquoise=Color(191,255,239)
+lightest_cyan=Color(191,255,255)
+lightest_sky=Color(191,239,255)
+lightest_azure=Color(191,223,255)
+lightest_blue=Color(191,191,255)
+lightest_han=Color(207,191,255)
+lightest_violet=Color(223,191,255)
+lightest_purple=Color(239,191,255)
+lightest_fuchsia=Color(255,191,255)
+lightest_magenta=Color(255,191,239)
+lightest_pink=Color(255,191,223)
+lightest_crimson=Color(255,191,207)
+
+# desaturated colors
+desaturated_red=Color(127,63,63)
+desaturated_flame=Color(127,79,63)
+desaturated_orange=Color(127,95,63)
+desaturated_amber=Color(127,111,63)
+desaturated_yellow=Color(127,127,63)
+desaturated_lime=Color(111,127,63)
+desaturated_chartreuse=Color(95,127,63)
+desaturated_green=Color(63,127,63)
+desaturated_sea=Color(63,127,95)
+desaturated_turquoise=Color(63,127,111)
+desaturated_cyan=Color(63,127,127)
+desaturated_sky=Color(63,111,127)
+desaturated_azure=Color(63,95,127)
+desaturated_blue=Color(63,63,127)
+desaturated_han=Color(79,63,127)
+desaturated_violet=Color(95,63,127)
+desaturated_purple=Color(111,63,127)
+desaturated_fuchsia=Color(127,63,127)
+desaturated_magenta=Color(127,63,111)
+desaturated_pink=Color(127,63,95)
+desaturated_crimson=Color(127,63,79)
+
+# metallic
+brass=Color(191,151,96)
+copper=Color(197,136,124)
+gold=Color(229,191,0)
+silver=Color(203,203,203)
+
+# miscellaneous
+celadon=Color(172,255,175)
+peach=Color(255,159,127)
+
+# background rendering modes: blend.py's, which are libtcod's. All of them are
+# libtcodpy's API, so they are bound here, not just imported.
+import blend as _modes
+BKGND_NONE = _modes.BKGND_NONE
+BKGND_SET = _modes.BKGND_SET
+BKGND_MULTIPLY = _modes.BKGND_MULTIPLY
+BKGND_LIGHTEN = _modes.BKGND_LIGHTEN
+BKGND_DARKEN = _modes.BKGND_DARKEN
+BKGND_SCREEN = _modes.BKGND_SCREEN
+BKGND_COLOR_DODGE = _modes.BKGND_COLOR_DODGE
+BKGND_COLOR_BURN = _modes.BKGND_COLOR_BURN
+BKGND_ADD = _modes.BKGND_ADD
+BKGND_ADDA = _modes.BKGND_ADDA
+BKGND_BURN = _modes.BKGND_BURN
+BKGND_OVERLAY = _modes.BKGND_OVERLAY
+BKGND_ALPH = _modes.BKGND_ALPH
+BKGND_DEFAULT = _modes.BKGND_DEFAULT
+BKGND_ALPHA = _modes.BKGND_ALPHA
+BKGND_ADDALPHA = _modes.BKGND_ADDALPHA
+
+# non blocking key events types
+KEY_PRESSED = 1
+KEY_RELEASED = 2
+# key codes
+KEY_NONE = 0
+KEY_ESCAPE = 1
+KEY_BACKSPACE = 2
+KEY_TAB = 3
+KEY_ENTER = 4
+KEY_SHIFT = 5
+KEY_CONTROL = 6
+KEY_ALT = 7
+KEY_PAUSE = 8
+KEY_CAPSLOCK = 9
+KEY_PAGEUP = 10
+KEY_PAGEDOWN = 11
+KEY_END = 12
+KEY_HOME = 13
+KEY_UP = 14
+KEY_LEFT = 15
+KEY_RIGHT = 16
+KEY_DOWN = 17
+KEY_PRINTSCREEN = 18
+KEY_INSERT = 19
+KEY_DELETE = 20
+KEY_LWIN = 21
+KEY_RWIN = 22
+KEY_APPS = 23
+KEY_0 = 24
+KEY_1 = 25
+KEY_2 = 26
+KEY_3 = 27
+KEY_4 = 28
+KEY_5 = 29
+KEY_6 = 30
+KEY_7 = 31
+KEY_8 = 32
+KEY_9 = 33
+KEY_KP0 = 34
+KEY_KP1 = 35
+KEY_KP2 = 36
+KEY_KP3 = 37
+KEY_KP4 = 38
+KEY_KP5 = 39
+KEY_KP6 = 40
+KEY_KP7 = 41
+KEY_KP8 = 42
+KEY_KP9 = 43
+KEY_KPADD = 44
+KEY_KPSUB = 45
+KEY_KPDIV = 46
+KEY_KPMUL = 47
+KEY_KPDEC = 48
+KEY_KPENTER = 49
+KEY_F1 = 50
+KEY_F2 = 51
+KEY_F3 = 52
+KEY_F4 = 53
+KEY_F5 = 54
+KEY_F6 = 55
+KEY_F7 = 56
+KEY_F8 = 57
+KEY_F9 = 58
+KEY_F10 = 59
+KEY_F11 = 60
+KEY_F12 = 61
+KEY_NUMLOCK = 62
+KEY_SCROLLLOCK = 63
+KEY_SPACE = 64
+KEY_CHAR = 65
+# special chars
+# single walls
+CHAR_HLINE = 196
+CHAR_VLINE = 179
+CHAR_NE = 191
+CHAR_NW = 218
+CHAR_SE = 217
+CHAR_SW = 192
+CHAR_TEEW = 180
+CHAR_TEEE = 195
+CHAR_TEEN = 193
+CHAR_TEES = 194
+CHAR_CROSS = 197
+
+# font flags
+FONT_LAYOUT_ASCII_INCOL = 1
+FONT_LAYOUT_ASCII_INROW = 2
+FONT_TYPE_GREYSCALE = 4
+FONT_TYPE_GRAYSCALE = 4
+FONT_LAYOUT_TCOD = 8
+# color control codes
+COLCTRL_1=1
+COLCTRL_2=2
+COLCTRL_3=3
+COLCTRL_4=4
+COLCTRL_5=5
+COLCTRL_NUMBER=5
+COLCTRL_FORE_RGB=6
+COLCTRL_BACK_RGB=7
+COLCTRL_STOP=8
+# renderers
+RENDERER_GLSL=0
+RENDERER_OPENGL=1
+RENDERER_SDL=2
+NB_RENDERERS=3
+# alignment
+LEFT=0
+RIGHT=1
+CENTER=2
+
+# events
+EVENT_KEY_PRESS=1
+EVENT_KEY_RELEASE=2
+EVENT_KEY=EVENT_KEY_PRESS|EVENT_KEY_RELEASE
+EVENT_MOUSE_MOVE=4
+EVENT_MOUSE_PRESS=8
+EVENT_MOUSE_RELEASE=16
+EVENT_MOUSE=EVENT_MOUSE_MOVE|EVENT_MOUSE_PRESS|EVENT_MOUSE_RELEASE
+EVENT_ANY=EVENT_KEY|EVENT_MOUSE
+EVENT_NONE=0
+
+############################
+# console state
+############################
+class Key(object):
+    _fields = ('vk', 'c', 'pressed', 'lalt', 'lctrl', 'ralt', 'rctrl', 'shift')
+
+    def __init__(self, **kwargs):
+        self.vk = KEY_NONE
+        self.c = 0
+        self.pressed = self.lalt = self.lctrl = self.ralt = self.rctrl = self.shift = False
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+class Mouse(object):
+    _fields = ('x', 'y', 'dx', 'dy', 'cx', 'cy', 'dcx', 'dcy',
+               'lbutton', 'rbutton', 'mbutton',
+               'lbutton_pressed', 'rbutton_pressed', 'mbutton_pressed',
+               'wheel_up', 'wheel_down')
+
+    def __init__(self, **kwargs):
+        for i, name in enumerate(self._fields):
+            setattr(self, name, 0 if i < 8 else False) # coordinates, then flags
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+def _copy_fields(dest, src):
+    for name in src._fields:
+        setattr(dest, name, getattr(src, name))
+
+class CellBuffer(object):
+    """
+    The contents of one console: ch is a (height, width) array of character
+    codes, fg and bg are (height, width, 3) arrays of colors.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.ch = numpy.empty((height, width), dtype=numpy.int32)
+        self.fg = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.bg = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.default_fg = (255, 255, 255)
+        self.default_bg = (0, 0, 0)
+        self.key_color = None
+        self.clear()
+
+    def clear(self):
+        self.ch[:] = ord(' ')
+        self.fg[:] = self.default_fg
+        self.bg[:] = self.default_bg
+
+    def text(self):
+        """ The characters of the buffer, as one string per line. """
+        return [''.join([chr(c) for c in row]) for row in self.ch]
+
+ROOT = 0
+buffers = {ROOT: CellBuffer(0, 0)}
+_next_id = [ROOT + 1]
+_color_controls = dict((code, ((255, 255, 255), (0, 0, 0))) for code in range(COLCTRL_1, COLCTRL_NUMBER + 1))
+
+window_title = None
+window_fullscreen = False
+window_closed = False
+custom_font = None
+
+def get_buffer(con):
+    """ The CellBuffer behind a console id, for inspecting what was drawn. """
+    return buffers[con or ROOT]
+
+def _rgb(col):
+    return (col.r, col.g, col.b)
+
+def _clip(buf, x, y, w, h):
+    """ Clips the rectangle to the buffer, returning (x0, y0, x1, y1). """
+    return max(0, x), max(0, y), min(buf.width, x + w), min(buf.height, y + h)
+
+############################
+# console module
+############################
+def console_init_root(w, h, title, fullscreen=False, renderer=RENDERER_SDL):
+    global window_title, window_fullscreen, window_closed
+    window_title = title
+    window_fullscreen = fullscreen
+    window_closed = False
+    buffers[ROOT] = CellBuffer(w, h)
+
+def console_set_custom_font(fontFile, flags=FONT_LAYOUT_ASCII_INCOL, nb_char_horiz=0, nb_char_vertic=0):
+    global custom_font
+    custom_font = (fontFile, flags, nb_char_horiz, nb_char_vertic)
+
+def console_is_fullscreen():
+    return window_fullscreen
+
+def console_set_fullscreen(fullscreen):
+    global window_fullscreen
+    window_fullscreen = bool(fullscreen)
+
+def console_is_window_closed():
+    return window_closed
+
+def close_window():
+    """ Pretends the user closed the window. """
+    global window_closed
+    window_closed = True
+
+def console_new(w, h):
+    con = _next_id[0]
+    _next_id[0] += 1
+    buffers[con] = CellBuffer(w, h)
+    return con
+
+def console_delete(con):
+    buffers.pop(con, None)
+
+def console_get_width(con):
+    return get_buffer(con).width
+
+def console_get_height(con):
+    return get_buffer(con).height
+
+def console_set_default_background(con, col):
+    get_buffer(con).default_bg = _rgb(col)
+
+def console_set_default_foreground(con, col):
+    get_buffer(con).default_fg = _rgb(col)
+
+def console_get_default_background(con):
+    return Color(*get_buffer(con).default_bg)
+
+def console_get_default_foreground(con):
+    return Color(*get_buffer(con).default_fg)
+
+def console_set_key_color(con, col):
+    get_buffer(con).key_color = _rgb(col)
+
+def console_clear(con):
+    get_buffer(con).clear()
+
+def console_set_color_control(con, fore, back):
+    _color_controls[con] = (_rgb(fore), _rgb(back))
+
+def console_put_char(con, x, y, c, flag=BKGND_DEFAULT):
+    buf = get_buffer(con)
+    if not (0 <= x < buf.width and 0 <= y < buf.height):
+        return
+    if type(c) == str:
+        c = ord(c)
+    buf.ch[y, x] = c
+    buf.fg[y, x] = buf.default_fg
+    buf.bg[y, x] = blend(buf.bg[y, x], buf.default_bg, flag)
+
+def console_put_char_ex(con, x, y, c, fore, back):
+    buf = get_buffer(con)
+    if not (0 <= x < buf.width and 0 <= y < buf.height):
+        return
+    if type(c) == str:
+        c = ord(c)
+    buf.ch[y, x] = c
+    buf.fg[y, x] = _rgb(fore)
+    buf.bg[y, x] = _rgb(back)
+
+def console_set_char_background(con, x, y, col, flag=BKGND_SET):
+    buf = get_buffer(con)
+    if 0 <= x < buf.width and 0 <= y < buf.height:
+        buf.bg[y, x] = blend(buf.bg[y, x], _rgb(col), flag)
+
+def console_rect(con, x, y, w, h, clr, flag=BKGND_DEFAULT):
+    buf = get_buffer(con)
+    x0, y0, x1, y1 = _clip(buf, x, y, w, h)
+    if x0 >= x1 or y0 >= y1:
+        return
+    buf.bg[y0:y1, x0:x1] = blend(buf.bg[y0:y1, x0:x1], buf.default_bg, flag)
+    if clr:
+        buf.ch[y0:y1, x0:x1] = ord(' ')
+
+def console_hline(con, x, y, l, flag=BKGND_DEFAULT):
+    for i in range(l):
+        console_put_char(con, x + i, y, CHAR_HLINE, flag)
+
+def console_vline(con, x, y, l, flag=BKGND_DEFAULT):
+    for i in range(l):
+        console_put_char(con, x, y + i, CHAR_VLINE, flag)
+
+def console_print_frame(con, x, y, w, h, clear=True, flag=BKGND_DEFAULT, fmt=0):
+    console_put_char(con, x, y, CHAR_NW, flag)
+    console_put_char(con, x + w - 1, y, CHAR_NE, flag)
+    console_put_char(con, x, y + h - 1, CHAR_SW, flag)
+    console_put_char(con, x + w - 1, y + h - 1, CHAR_SE, flag)
+    console_hline(con, x + 1, y, w - 2, flag)
+    console_hline(con, x + 1, y + h - 1, w - 2, flag)
+    if h > 2:
+        console_vline(con, x, y + 1, h - 2, flag)
+        console_vline(con, x + w - 1, y + 1, h - 2, flag)
+        if clear:
+            console_rect(con, x + 1, y + 1, w - 2, h - 2, True, flag)
+    if fmt:
+        _print(con, x + w / 2, y, 0, 0, BKGND_SET, CENTER, ' %s ' % fmt, rect=False)
+
+def _print(con, x, y, w, h, flag, align, text, rect):
+    """ The guts of all the console_print*() variants; returns the height. """
+    buf = get_buffer(con)
+    if rect:
+        if w == 0:
+            w = buf.width - x
+        if h == 0:
+            h = buf.height - y
+        lines = wrap_text(text, w)[:max(0, h)]
+    else:
+        lines = text.split('\n')
+
+    fg, bg = buf.default_fg, buf.default_bg
+    for row, line in enumerate(lines):
+        length = len(line.translate(None, CONTROL_CHARS))
+        if align == LEFT:
+            cx = x
+        elif align == RIGHT:
+            cx = (x + w - length) if rect else (x - length + 1)
+        else:
+            cx = (x + (w - length) / 2) if rect else (x - length / 2)
+
+        cy = y + row
+        for char in line:
+            code = ord(char)
+            if COLCTRL_1 <= code <= COLCTRL_NUMBER:
+                fg, bg = _color_controls[code]
+                continue
+            elif code == COLCTRL_STOP:
+                fg, bg = buf.default_fg, buf.default_bg
+                continue
+
+            if 0 <= cx < buf.width and 0 <= cy < buf.height:
+                buf.ch[cy, cx] = code
+                buf.fg[cy, cx] = fg
+                buf.bg[cy, cx] = blend(buf.bg[cy, cx], bg, flag)
+            cx += 1
+
+    return len(lines)
+
+def console_print(con, x, y, fmt):
+    _print(con, x, y, 0, 0, BKGND_DEFAULT, LEFT, fmt, rect=False)
+
+def console_print_ex(con, x, y, flag, alignment, fmt):
+    _print(con, x, y, 0, 0, flag, alignment, fmt, rect=False)
+
+def console_print_rect(con, x, y, w, h, fmt):
+    return _print(con, x, y, w, h, BKGND_DEFAULT, LEFT, fmt, rect=True)
+
+def console_print_rect_ex(con, x, y, w, h, flag, alignment, fmt):
+    return _print(con, x, y, w, h, flag, alignment, fmt, rect=True)
+
+def console_get_height_rect(con, x, y, w, h, fmt):
+    buf = get_buffer(con)
+    if w == 0:
+        w = buf.width - x
+    if h == 0:
+        h = buf.height - y
+    return min(len(wrap_text(fmt, w)), h)
+
+def console_blit(src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+    sbuf, dbuf = get_buffer(src), get_buffer(dst)
+    if w == 0:
+        w = sbuf.width
+    if h == 0:
+        h = sbuf.height
+
+    # Clip the rectangle to the source console...
+    if x < 0:
+        w, xdst, x = w + x, xdst - x, 0
+    if y < 0:
+        h, ydst, y = h + y, ydst - y, 0
+    w = min(w, sbuf.width - x)
+    h = min(h, sbuf.height - y)
+    # ...and to the destination one.
+    if xdst < 0:
+        w, x, xdst = w + xdst, x - xdst, 0
+    if ydst < 0:
+        h, y, ydst = h + ydst, y - ydst, 0
+    w = min(w, dbuf.width - xdst)
+    h = min(h, dbuf.height - ydst)
+    if w <= 0 or h <= 0:
+        return
+
+    s = (slice(y, y + h), slice(x, x + w))
+    d = (slice(ydst, ydst + h), slice(xdst, xdst + w))
+    sch, sfg, sbg = sbuf.ch[s], sbuf.fg[s], sbuf.bg[s]
+    dch, dfg, dbg = dbuf.ch[d], dbuf.fg[d], dbuf.bg[d]
+
+    mask = numpy.ones(sch.shape, dtype=bool)
+    if sbuf.key_color is not None:
+        mask = numpy.any(sbg != sbuf.key_color, axis=-1)
+
+    new_ch, new_fg, new_bg = fade(dch, dfg, dbg, sch, sfg, sbg, ffade, bfade)
+    dch[mask] = new_ch[mask]
+    dfg[mask] = new_fg[mask]
+    dbg[mask] = new_bg[mask]
+
+def _fill(con, target, channels):
+    buf = get_buffer(con)
+    for i, channel in enumerate(channels):
+        target[..., i] = numpy.asarray(channel).reshape(buf.height, buf.width)
+
+def console_fill_foreground(con, r, g, b):
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    _fill(con, get_buffer(con).fg, (r, g, b))
+
+def console_fill_background(con, r, g, b):
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    _fill(con, get_buffer(con).bg, (r, g, b))
+
+def console_fill_char(con, arr):
+    buf = get_buffer(con)
+    buf.ch[:] = numpy.asarray(arr).reshape(buf.height, buf.width)
+
+############################
+# input
+############################
+# Queued (event type, Key or Mouse) pairs, consumed by sys_check_for_event()
+input_queue = collections.deque()
+_mouse = Mouse()
+_pressed = set()
+
+def push_key(vk=KEY_CHAR, c=0, pressed=True, **kwargs):
+    """ Queues a key event; c may be given as a one-character string. """
+    if type(c) == str:
+        c = ord(c)
+    key = Key(vk=vk, c=c, pressed=pressed, **kwargs)
+    input_queue.append((EVENT_KEY_PRESS if pressed else EVENT_KEY_RELEASE, key))
+
+def push_mouse(cx=None, cy=None, lbutton=None, rbutton=None, mbutton=None,
+               wheel_up=False, wheel_down=False):
+    """
+    Queues a mouse event moving the cursor to cell (cx, cy) and/or changing
+    the button states; anything left as None keeps its previous value.
+    """
+    prev = input_queue[-1][1] if input_queue and isinstance(input_queue[-1][1], Mouse) else _mouse
+    mouse = Mouse()
+    _copy_fields(mouse, prev)
+    mouse.cx = prev.cx if cx is None else cx
+    mouse.cy = prev.cy if cy is None else cy
+    mouse.dcx, mouse.dcy = mouse.cx - prev.cx, mouse.cy - prev.cy
+    mouse.x, mouse.y = mouse.cx * CELL_SIZE[0], mouse.cy * CELL_SIZE[1]
+    mouse.dx, mouse.dy = mouse.dcx * CELL_SIZE[0], mouse.dcy * CELL_SIZE[1]
+
+    event = EVENT_MOUSE_MOVE
+    for name, state in (('lbutton', lbutton), ('rbutton', rbutton), ('mbutton', mbutton)):
+        was_down = getattr(prev, name)
+        setattr(mouse, name + '_pressed', False)
+        if state is None:
+            continue
+        setattr(mouse, name, state)
+        if state and not was_down:
+            event = EVENT_MOUSE_PRESS
+        elif was_down and not state:
+            setattr(mouse, name + '_pressed', True) # libtcod: "pressed" means clicked and released
+            event = EVENT_MOUSE_RELEASE
+    mouse.wheel_up, mouse.wheel_down = wheel_up, wheel_down
+    input_queue.append((event, mouse))
+
+# The (pretend) size of a character cell, in pixels
+CELL_SIZE = (8, 8)
+
+def sys_check_for_event(mask, k, m):
+    while input_queue:
+        event, data = input_queue.popleft()
+        if isinstance(data, Mouse):
+            _copy_fields(_mouse, data)
+        elif data.pressed:
+            _pressed.add(data.vk)
+        else:
+            _pressed.discard(data.vk)
+
+        if event & mask:
+            if isinstance(data, Key):
+                _copy_fields(k, data)
+            _copy_fields(m, _mouse)
+            return event
+
+    _copy_fields(m, _mouse)
+    m.lbutton_pressed = m.rbutton_pressed = m.mbutton_pressed = False
+    m.wheel_up = m.wheel_down = False
+    return EVENT_NONE
+
+def sys_wait_for_event(mask, k, m, flush):
+    """ Never blocks: with nothing queued there is nothing to wait for. """
+    if flush:
+        input_queue.clear()
+    return sys_check_for_event(mask, k, m)
+
+def console_wait_for_keypress(flush):
+    k = Key()
+    sys_wait_for_event(EVENT_KEY_PRESS, k, Mouse(), flush)
+    return k
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    k = Key()
+    sys_check_for_event(EVENT_KEY_PRESS if flags & KEY_PRESSED else EVENT_KEY_RELEASE, k, Mouse())
+    return k
+
+def console_is_key_pressed(key):
+    return key in _pressed
+
+############################
+# sys module
+############################
+# Set to True to have console_flush() sleep to honour sys_set_fps()
+throttle = False
+# Called as hook(frame_number) at the end of every console_flush()
+flush_hooks = []
+
+frame_count = 0
+_fps_limit = 0
+_start = time.time()
+_last_flush = _start
+_last_frame_length = 0.0
+_recent_flushes = collections.deque()
+
+def console_flush():
+    global frame_count, _last_flush, _last_frame_length
+    now = time.time()
+    if throttle and _fps_limit > 0:
+        delay = (1.0 / _fps_limit) - (now - _last_flush)
+        if delay > 0:
+            time.sleep(delay)
+            now = time.time()
+
+    _last_frame_length = now - _last_flush
+    _last_flush = now
+    _recent_flushes.append(now)
+    while _recent_flushes[0] < now - 1.0:
+        _recent_flushes.popleft()
+
+    frame_count += 1
+    for hook in list(flush_hooks):
+        hook(frame_count)
+
+def sys_set_fps(fps):
+    global _fps_limit
+    _fps_limit = fps
+
+def sys_get_fps():
+    return len(_recent_flushes)
+
+def sys_get_last_frame_length():
+    return _last_frame_length
+
+def sys_sleep_milli(val):
+    time.sleep(val / 1000.0)
+
+def sys_elapsed_milli():
+    return int((time.time() - _start) * 1000)
+
+def sys_elapsed_seconds():
+    return time.time() - _start
+
+############################
+# random module
+############################
+_randoms = {}
+
+def random_get_int(rnd, mi, ma):
+    if rnd not in _randoms:
+        _randoms[rnd] = random.Random(rnd)
+    return _randoms[rnd].randint(min(mi, ma), max(mi, ma))
+
+############################
+# image module
+############################
+images = {}
+
+def image_new(width, height):
+    image = _next_id[0]
+    _next_id[0] += 1
+    images[image] = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+    return image
+
+def image_load(filename):
+    image = image_new(0, 0)
+    images[image] = _read_png(filename)
+    return image
+
+def image_get_size(image):
+    height, width = images[image].shape[:2]
+    return width, height
+
+def image_delete(image):
+    images.pop(image, None)
+
+def image_blit_2x(image, console, dx, dy, sx=0, sy=0, w=-1, h=-1):
+    pixels = images[image]
+    if w == -1:
+        w = pixels.shape[1] - sx
+    if h == -1:
+        h = pixels.shape[0] - sy
+    pixels = pixels[sy:sy + h, sx:sx + w]
+
+    # Pad to an even size, then average each 2x2 block into one cell
+    h, w = pixels.shape[:2]
+    pixels = numpy.pad(pixels, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+    cells = pixels.reshape(pixels.shape[0] / 2, 2, pixels.shape[1] / 2, 2, 3).mean(axis=(1, 3))
+
+    buf = get_buffer(console)
+    x0, y0, x1, y1 = _clip(buf, dx, dy, cells.shape[1], cells.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return
+    cells = cells[y0 - dy:y1 - dy, x0 - dx:x1 - dx]
+    buf.bg[y0:y1, x0:x1] = cells.astype(numpy.uint8)
+    buf.ch[y0:y1, x0:x1] = ord(' ')
+
+def _read_png(filename):
+    """
+    Just enough of a PNG decoder for our own images: 8-bit, non-interlaced,
+    any color type. Returns a (height, width, 3) array; alpha is dropped.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:8] != '\x89PNG\r\n\x1a\n':
+        raise IOError("%s is not a PNG file" % filename)
+
+    pos, idat, palette = 8, [], None
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += length + 12
+        if kind == 'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunk)
+        elif kind == 'PLTE':
+            palette = numpy.frombuffer(chunk, dtype=numpy.uint8).reshape(-1, 3)
+        elif kind == 'IDAT':
+            idat.append(chunk)
+        elif kind == 'IEND':
+            break
+
+    if depth != 8 or interlace:
+        raise IOError("%s: only 8-bit, non-interlaced PNGs are supported" % filename)
+
+    bpp = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color_type]
+    stride = width * bpp
+    raw = bytearray(zlib.decompress(''.join(idat)))
+    rows = numpy.zeros((height, stride), dtype=numpy.uint8)
+    prev = bytearray(stride)
+    for y in range(height):
+        kind = raw[y * (stride + 1)]
+        row = raw[y * (stride + 1) + 1:(y + 1) * (stride + 1)]
+        if kind == 1: # Sub
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xff
+        elif kind == 2: # Up
+            for i in range(stride):
+                row[i] = (row[i] + prev[i]) & 0xff
+        elif kind == 3: # Average
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xff
+        elif kind == 4: # Paeth
+            for i in range(stride):
+                a = row[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    pred = a
+                elif pb <= pc:
+                    pred = b
+                else:
+                    pred = c
+                row[i] = (row[i] + pred) & 0xff
+        rows[y] = numpy.frombuffer(bytes(row), dtype=numpy.uint8)
+        prev = row
+
+    pixels = rows.reshape(height, width, bpp)
+    if color_type == 3:
+        return palette[pixels[..., 0]]
+    elif color_type in (0, 4):
+        return numpy.repeat(pixels[..., :1], 3, axis=-1)
+    return pixels[..., :3].copy()
@@ -0,0 +1,46 @@
+""" Text layout helpers shared by the wrapper and its backends. """
+
+# The color control codes libtcod understands when printing (COLCTRL_1 to
+# COLCTRL_5, and COLCTRL_STOP); they take up no room on screen.
+CONTROL_CHARS = ''.join([chr(x) for x in (1, 2, 3, 4, 5, 8)])
+
+def wrap_text(text, width, control_chars=CONTROL_CHARS):
+    """
+    Breaks text into lines no wider than width, the same way libtcod's
+    print_rect does: explicit newlines always break, otherwise the line is
+    broken at its last space (which is swallowed), or mid-word if there is no
+    space to break at. A width below 1 means no wrapping at all.
+    """
+    if width < 1:
+        return text.split('\n')
+
+    lines = []
+    for paragraph in text.split('\n'):
+        start = i = length = 0
+        split = None
+        while i < len(paragraph):
+            char = paragraph[i]
+            if char in control_chars:
+                i += 1
+                continue
+
+            if length == width:
+                if char == ' ':
+                    lines.append(paragraph[start:i])
+                    start = i = i + 1
+                elif split is not None:
+                    lines.append(paragraph[start:split])
+                    start = split + 1
+                else:
+                    lines.append(paragraph[start:i])
+                    start = i
+                length = len(paragraph[start:i].translate(None, control_chars))
+                split = None
+                continue
+
+            if char == ' ':
+                split = i
+            length += 1
+            i += 1
+        lines.append(paragraph[start:])
+    return lines
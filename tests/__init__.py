@@ -0,0 +1,12 @@
+"""
+Tests, run from the top of the checkout with
+
+    python -m unittest discover -s tests -t .
+
+They use the headless tcod backend, and never save the options.
+"""
+import os
+os.environ['TCOD_BACKEND'] = 'headless'
+
+import game
+game.config.save_on_exit = False
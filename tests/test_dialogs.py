@@ -0,0 +1,57 @@
+import threading, time, unittest
+
+from tcod import headless
+from game import events, dialogs
+
+class InputStageTest(unittest.TestCase):
+    def setUp(self):
+        headless.input_queue.clear()
+        self.stage = dialogs.InputStage()
+        list(events.generator())
+
+    def tearDown(self):
+        list(events.generator())
+
+    def push_keys(self, count):
+        for i in xrange(count):
+            headless.push_key(c='a')
+
+    def test_same_key_twice_in_a_frame(self):
+        self.stage.key_repeat_rate = 30
+        self.push_keys(2)
+        self.stage.poll()
+        self.assertEqual((self.stage.raw, self.stage.posted), (2, 2))
+
+    def test_key_repeats_throttled(self):
+        events.game_clock.reset()
+        self.stage.key_repeat_rate = 30
+        self.push_keys(3) # only one repeat a frame
+        self.stage.poll()
+        self.assertEqual((self.stage.raw, self.stage.posted), (3, 2))
+
+        self.push_keys(1) # too soon after the last one
+        self.stage.poll()
+        self.assertEqual((self.stage.raw, self.stage.posted), (1, 0))
+
+        time.sleep(0.05)
+        self.push_keys(2)
+        self.stage.poll()
+        self.assertEqual((self.stage.raw, self.stage.posted), (2, 1))
+
+    def test_wait_ends_on_threadsafe_post(self):
+        events.dispatcher.open_inbox()
+        def post_later():
+            time.sleep(0.05)
+            events.post_threadsafe(events.APPLY)
+        thread = threading.Thread(target=post_later)
+        thread.start()
+        try:
+            self.stage.poll(wait=True)
+            self.assertTrue(events.pending())
+        finally:
+            events.dispatcher.close_inbox()
+            thread.join()
+        self.assertEqual([event.type for event in events.generator()], [events.APPLY])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from game import tasks
+
+class TaskLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = tasks.TaskLoop()
+
+    def run_loop(self, passes=3):
+        for i in xrange(passes):
+            self.loop.run(0)
+
+    def test_bad_yield_fails_only_that_task(self):
+        steps = []
+        def bad():
+            yield 0.5
+            steps.append('bad') # never gets here
+        def forgot_to_call():
+            yield tasks.sleep
+        def good():
+            for i in xrange(3):
+                steps.append(i)
+                yield
+
+        bad_tasks = [self.loop.spawn(bad()), self.loop.spawn(forgot_to_call())]
+        good_task = self.loop.spawn(good())
+        self.run_loop(5)
+        self.assertFalse(self.loop.pending)
+
+        for task in bad_tasks:
+            self.assertTrue(task.done())
+            self.assertIs(task.exc_info[0], TypeError)
+        self.assertTrue(good_task.done())
+        self.assertIsNone(good_task.exc_info)
+        self.assertEqual(steps, [0, 1, 2])
+
+    def test_waits_for_other_task(self):
+        order = []
+        def inner():
+            order.append('inner')
+            yield
+        def outer():
+            yield self.loop.spawn(inner())
+            order.append('outer')
+
+        self.loop.spawn(outer())
+        self.run_loop()
+        self.assertEqual(order, ['inner', 'outer'])
+
+if __name__ == '__main__':
+    unittest.main()
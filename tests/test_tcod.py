@@ -0,0 +1,22 @@
+import unittest
+
+import tcod
+from tcod import headless
+
+class ConsoleTest(unittest.TestCase):
+    def test_growing_clears_what_comes_into_view(self):
+        console = tcod.Console(12, 12) # in a 16x16 native console
+        console.set_default_background(tcod.color.BLACK)
+        console.put_char(14, 3, ord('x'))
+        console.put_char(3, 14, ord('y'))
+        console.put_char(2, 2, ord('z'))
+        console.resize(16, 16)
+
+        buf = headless.get_buffer(console.console_id)
+        self.assertEqual(buf.ch[3, 14], ord(' '))
+        self.assertEqual(buf.ch[14, 3], ord(' '))
+        self.assertEqual(buf.ch[2, 2], ord('z'))
+        console.close()
+
+if __name__ == '__main__':
+    unittest.main()